@@ -1,4 +1,13 @@
-import hexhex.interactive.interactive
+import sys
 
 if __name__ == '__main__':
-    hexhex.interactive.interactive.main()
+    # entry points are imported on demand, so e.g. the GTP engine never loads pygame
+    if sys.argv[1:2] == ['serve']:
+        import hexhex.serving.server
+        hexhex.serving.server.main()
+    elif sys.argv[1:2] == ['gtp']:
+        import hexhex.interactive.play_cli
+        hexhex.interactive.play_cli.main()
+    else:
+        import hexhex.interactive.interactive
+        hexhex.interactive.interactive.main()
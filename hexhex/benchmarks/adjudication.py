@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+compares self-play with and without adjudication on the same seeded games
+python -m hexhex.benchmarks.adjudication [model_name] [num_games] [resign_threshold]
+without model_name an untrained model of size 11 is used, which rarely resigns
+"""
+import sys
+import time
+
+from hexhex.benchmarks.common import create_benchmark_model, seed_everything
+from hexhex.creation.noise import game_seeds
+from hexhex.logic.adjudication import Adjudicator
+from hexhex.logic.hexboard import Board
+from hexhex.logic.hexgame import MultiHexGame
+from hexhex.model import registry
+from hexhex.utils.profiling import timer
+
+
+def self_play(model, num_games, adjudicator, batch_size=128, temperature=1., seed=0):
+    """
+    returns the number of recorded positions, seconds and the adjudication counters
+    """
+    timer.reset()
+    positions = 0
+    start = time.perf_counter()
+    for first_game in range(0, num_games, batch_size):
+        games = min(batch_size, num_games - first_game)
+        game = MultiHexGame([Board(model.board_size) for _ in range(games)], (model,), noise=None,
+                            noise_parameters=None, temperature=temperature, temperature_decay=1.,
+                            seeds=game_seeds(seed, first_game, games), adjudicator=adjudicator)
+        board_states, _, _ = game.play_moves()
+        positions += len(board_states)
+    seconds = time.perf_counter() - start
+    counters = {name: value for name, value in timer.counters.items()
+                if name.startswith(('calibration', 'virtual', 'resign'))}
+    return positions, seconds, counters
+
+
+def run(model, num_games=512, resign_threshold=0.05, calibration_fraction=0.1):
+    report = {}
+    for name, adjudicator in [
+            ('none', None),
+            ('virtual_connections', Adjudicator(True, 0., calibration_fraction)),
+            ('virtual_connections_and_resign', Adjudicator(True, resign_threshold, calibration_fraction))]:
+        positions, seconds, counters = self_play(model, num_games, adjudicator)
+        report[name] = dict(positions=positions, seconds=seconds, positions_per_second=positions / seconds,
+                            games_per_second=num_games / seconds, **counters)
+    return report
+
+
+if __name__ == '__main__':
+    seed_everything(0)
+    if len(sys.argv) > 1:
+        model = registry.get_model(sys.argv[1])
+    else:
+        model = create_benchmark_model(11, 8, 32)
+    num_games = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    resign_threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    for name, results in run(model, num_games, resign_threshold).items():
+        print(name)
+        for key, value in results.items():
+            print(f'    {key:45} {value:.2f}' if isinstance(value, float) else f'    {key:45} {value}')
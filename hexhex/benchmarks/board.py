@@ -0,0 +1,104 @@
+"""
+benchmarks the pure python board logic, no model involved
+"""
+import random
+
+from hexhex.benchmarks.common import rate
+from hexhex.logic import distance, hexboard
+from hexhex.logic.solver import Solver
+
+
+def random_game(board_size):
+    board = hexboard.Board(board_size, switch_allowed=False)
+    moves = hexboard.all_moves(board_size)
+    random.shuffle(moves)
+    for move in moves:
+        if board.winner:
+            break
+        board.set_stone(move)
+    return board
+
+
+def moves_per_second(board_size, min_time):
+    return rate(lambda: len(random_game(board_size).move_history), min_time)
+
+
+def win_checks_per_second(board_size, min_time):
+    """
+    replays the stones of random games through update_connected_sets_check_win
+    """
+    games = [random_game(board_size).move_history for _ in range(16)]
+
+    def check():
+        for move_history in games:
+            connected_sets = [[], []]
+            for player, position in move_history:
+                connected_sets[player], _ = hexboard.update_connected_sets_check_win(
+                    connected_sets[player], player, position, board_size)
+        return sum(len(move_history) for move_history in games)
+    return rate(check, min_time)
+
+
+def neighbour_lookups_per_second(board_size, min_time):
+    positions = hexboard.all_moves(board_size)
+
+    def lookup():
+        for position in positions:
+            hexboard.get_neighbours(position, board_size)
+        return len(positions)
+    return rate(lookup, min_time)
+
+
+def distance_evaluations_per_second(board_size, min_time):
+    """
+    connection distances of both players on half filled boards
+    """
+    boards = []
+    for _ in range(16):
+        board = hexboard.Board(board_size, switch_allowed=False)
+        moves = hexboard.all_moves(board_size)
+        random.shuffle(moves)
+        for move in moves[:board_size ** 2 // 2]:
+            if board.winner:
+                break
+            board.set_stone(move)
+        boards.append(board)
+
+    def evaluate():
+        for board in boards:
+            distance.board_distances(board)
+        return len(boards)
+    return rate(evaluate, min_time)
+
+
+def solved_positions_per_second(board_size, min_time, num_empty=10):
+    """
+    exact results of random positions with num_empty empty cells, each solved with an empty transposition table
+    """
+    boards = []
+    while len(boards) < 16:
+        board = random_game(board_size)
+        history = board.move_history[:board_size ** 2 - num_empty]
+        board = hexboard.Board(board_size, switch_allowed=False)
+        for _, position in history:
+            board.set_stone(position)
+        if not board.winner:
+            boards.append(board)
+    solver = Solver(board_size)
+
+    def solve():
+        for board in boards:
+            solver.table.clear()
+            solver.solve(board)
+        return len(boards)
+    return rate(solve, min_time)
+
+
+def run(board_size, min_time):
+    return {
+        'moves_per_second': moves_per_second(board_size, min_time),
+        'win_checks_per_second': win_checks_per_second(board_size, min_time),
+        'neighbour_lookups_per_second': neighbour_lookups_per_second(board_size, min_time),
+        'distance_evaluations_per_second': distance_evaluations_per_second(board_size, min_time),
+        'solved_positions_per_second': solved_positions_per_second(board_size, min_time),
+    }
@@ -0,0 +1,46 @@
+import random
+import time
+from configparser import ConfigParser
+
+import numpy as np
+import torch
+
+from hexhex.creation.create_model import create_model
+
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def create_benchmark_model(board_size, layers, intermediate_channels, reach=1):
+    """
+    untrained model with the architecture of create_model, its weights do not matter for speed
+    """
+    config = ConfigParser()
+    config.read_dict({'CREATE MODEL': {
+        'board_size': str(board_size),
+        'layers': str(layers),
+        'intermediate_channels': str(intermediate_channels),
+        'reach': str(reach),
+        'switch_model': 'True',
+        'rotation_model': 'True',
+    }})
+    model = create_model(config['CREATE MODEL'])
+    model.eval()
+    return model
+
+
+def rate(function, min_time):
+    """
+    calls function until min_time seconds have passed
+    function returns the number of units it processed, the result is units per second
+    """
+    units = 0
+    start = time.perf_counter()
+    while True:
+        units += function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return units / elapsed
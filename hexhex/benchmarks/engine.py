@@ -0,0 +1,55 @@
+"""
+benchmarks everything that evaluates a model: raw inference, batched self-play and MCTS
+"""
+from configparser import ConfigParser
+
+import torch
+
+from hexhex.benchmarks.common import rate
+from hexhex.logic import hexboard
+from hexhex.logic.hexgame import MultiHexGame
+from hexhex.model import mcts
+from hexhex.utils import utils
+
+INFERENCE_BATCH_SIZES = (1, 16, 128, 512)
+
+
+def positions_per_second(model, batch_size, min_time):
+    board = hexboard.Board(model.board_size)
+    boards_tensor = board.board_tensor.unsqueeze(0).repeat(batch_size, 1, 1, 1).to(utils.device)
+    model = model.to(utils.device)
+
+    def forward():
+        with torch.no_grad():
+            model(boards_tensor)
+        return batch_size
+    forward()
+    return rate(forward, min_time)
+
+
+def selfplay_samples_per_second(model, batch_size, min_time):
+    def play():
+        boards = [hexboard.Board(model.board_size) for _ in range(batch_size)]
+        game = MultiHexGame(boards, (model,), noise=None, noise_parameters=None, temperature=1.,
+                            temperature_decay=1.)
+        board_states, _, _ = game.play_moves()
+        return len(board_states)
+    return rate(play, min_time)
+
+
+def mcts_simulations_per_second(model, simulations, min_time):
+    config = ConfigParser()
+    config.read_dict({'MCTS': {'num_mcts_simulations': str(simulations)}})
+
+    def search():
+        mcts.Simulation(model, config['MCTS'], hexboard.Board(model.board_size)).run()
+        return simulations
+    return rate(search, min_time)
+
+
+def run(model, min_time, selfplay_batch_size=64, mcts_simulations=100):
+    results = {f'positions_per_second_batch_{batch_size}': positions_per_second(model, batch_size, min_time)
+               for batch_size in INFERENCE_BATCH_SIZES}
+    results['selfplay_samples_per_second'] = selfplay_samples_per_second(model, selfplay_batch_size, min_time)
+    results['mcts_simulations_per_second'] = mcts_simulations_per_second(model, mcts_simulations, min_time)
+    return results
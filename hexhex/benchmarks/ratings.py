@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+benchmarks the Bradley-Terry rating solver on synthetic tournaments
+python -m hexhex.benchmarks.ratings [num_models] [opponents_per_model]
+"""
+import math
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from hexhex.elo import elo
+
+
+def synthetic_tournament(num_models, opponents_per_model, games_per_pair=32, seed=0):
+    """
+    every model plays games_per_pair games against opponents_per_model random other models
+    true ratings are drawn around 0 with a standard deviation of 300 ELO
+    """
+    rng = np.random.RandomState(seed)
+    true_ratings = rng.normal(0, 300, num_models)
+    results = defaultdict(lambda: defaultdict(int))
+    for first in range(num_models):
+        others = np.delete(np.arange(num_models), first)
+        for second in rng.choice(others, min(opponents_per_model, num_models - 1), replace=False):
+            win_probability = 1 / (1 + 10 ** ((true_ratings[second] - true_ratings[first]) / 400))
+            first_wins = rng.binomial(games_per_pair, win_probability)
+            results[f'model_{first}'][f'model_{second}'] += first_wins
+            results[f'model_{second}'][f'model_{first}'] += games_per_pair - first_wins
+    return results
+
+
+def legacy_create_ratings(results, runs=100):
+    # dict based solver which create_ratings replaced, kept for comparison
+    all_models = set(results.keys())
+    for _, value in results.items():
+        for v in value.keys():
+            all_models.add(v)
+
+    results_sum = {x: sum(results[x][y] + 0.01 for y in all_models) for x in all_models}
+    p_list = results_sum.copy()
+
+    for _ in range(runs):
+        inverse_p_list = {idx1: {idx2: (results[idx1][idx2]+results[idx2][idx1] + 0.01)/(p_list[idx1]+p_list[idx2])
+                           for idx2 in all_models if idx1 != idx2} for idx1 in all_models}
+        new_p_list = {idx: results_sum[idx]/sum(inverse_p_list[idx].values()) for idx in all_models}
+        sum_p_list = sum(new_p_list.values())
+        p_list = {p: new_p_list[p]/sum_p_list for p in new_p_list}
+
+    min_value = p_list[list(results.keys())[0]]
+    return {p: math.log10(p_list[p]/min_value)*400 for p in p_list}
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    output = function(*args, **kwargs)
+    return output, time.perf_counter() - start
+
+
+def max_difference(ratings1, ratings2):
+    return max(abs(ratings1[name] - ratings2[name]) for name in ratings1)
+
+
+def run(num_models=1000, opponents_per_model=20, legacy_models=100):
+    """
+    returns a dict of timings in seconds and rating differences in ELO
+    the legacy solver is only run on a tournament of legacy_models models as it scales quadratically in python
+    """
+    report = {'num_models': num_models, 'opponents_per_model': opponents_per_model}
+
+    small = synthetic_tournament(legacy_models, opponents_per_model)
+    legacy, report['legacy_seconds'] = timed(legacy_create_ratings, small)
+    dense, report['dense_small_seconds'] = timed(elo.create_ratings, small)
+    report['dense_vs_legacy_max_elo_difference'] = max_difference(legacy, dense)
+
+    results = synthetic_tournament(num_models, opponents_per_model)
+    dense, report['dense_seconds'] = timed(elo.create_ratings, results, runs=1000)
+    sparse, report['sparse_seconds'] = timed(elo.create_ratings, results, runs=1000, sparse=True)
+    report['sparse_vs_dense_max_elo_difference'] = max_difference(dense, sparse)
+    (_, intervals), report['intervals_seconds'] = timed(elo.create_ratings_with_intervals, results, runs=1000)
+    report['mean_interval_half_width'] = float(np.mean(list(intervals.values())))
+    return report
+
+
+if __name__ == '__main__':
+    arguments = [int(argument) for argument in sys.argv[1:]]
+    for key, value in run(*arguments).items():
+        print(f'{key:40} {value:.4f}' if isinstance(value, float) else f'{key:40} {value}')
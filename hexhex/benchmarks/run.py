@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+runs the benchmark suite and writes the results as JSON
+python -m hexhex.benchmarks.run --sizes 5 11 --output benchmarks.json --baseline benchmarks/baseline.json
+
+results are rates, higher is better, except for those ending in _seconds
+the comparison reports the speedup against the baseline per measurement
+models are untrained and created with a fixed seed, so only the architecture influences the numbers
+"""
+import argparse
+import json
+import platform
+import sys
+
+import torch
+
+from hexhex.benchmarks import board, engine, ratings, startup, training
+from hexhex.benchmarks.common import create_benchmark_model, seed_everything
+from hexhex.elo import elo
+from hexhex.utils import utils
+
+SUITES = ('board', 'engine', 'training', 'ratings', 'startup')
+
+
+def run_suite(args):
+    results = {}
+    for board_size in args.sizes:
+        seed_everything(args.seed)
+        model = create_benchmark_model(board_size, args.layers, args.intermediate_channels)
+        size_results = {}
+        if 'board' in args.suites:
+            size_results.update(board.run(board_size, args.min_time))
+        if 'engine' in args.suites:
+            size_results.update(engine.run(model, args.min_time, args.selfplay_batch_size, args.mcts_simulations))
+        if 'training' in args.suites:
+            size_results.update(training.run(model, args.min_time))
+        results[str(board_size)] = size_results
+        for name, value in size_results.items():
+            print(f'{board_size:2} {name:40} {value:12.1f}', file=sys.stderr)
+    if 'ratings' in args.suites:
+        seed_everything(args.seed)
+        tournament = ratings.synthetic_tournament(200, 20, seed=args.seed)
+        _, seconds = ratings.timed(elo.create_ratings, tournament)
+        results['ratings'] = {'dense_solves_per_second_200_models': 1 / seconds}
+    if 'startup' in args.suites:
+        results['startup'] = startup.run(gtp=args.gtp)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    returns the speedup against the baseline for every measurement in both and the names of those
+    that are slower than the baseline by more than tolerance
+    """
+    ratios = {}
+    regressions = []
+    for group, measurements in results.items():
+        for name, value in measurements.items():
+            baseline_value = baseline.get(group, {}).get(name)
+            if not baseline_value:
+                continue
+            ratio = baseline_value / value if name.endswith('_seconds') else value / baseline_value
+            ratios[f'{group}/{name}'] = ratio
+            if ratio < 1 - tolerance:
+                regressions.append(f'{group}/{name}')
+    return ratios, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 11, 13, 19])
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--min-time', type=float, default=1., help='seconds per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--layers', type=int, default=18)
+    parser.add_argument('--intermediate-channels', type=int, default=64)
+    parser.add_argument('--selfplay-batch-size', type=int, default=64)
+    parser.add_argument('--mcts-simulations', type=int, default=100)
+    parser.add_argument('--gtp', action='store_true',
+                        help='also time the GTP engine, needs config.ini with a [PLAY CLI] model')
+    parser.add_argument('--output', help='write results to this JSON file instead of stdout')
+    parser.add_argument('--baseline', help='JSON file of an earlier run to compare against')
+    parser.add_argument('--save-baseline', help='also write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative slowdown reported as regression, exit code is 1 if there is any')
+    args = parser.parse_args()
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'device': str(utils.device),
+            'threads': torch.get_num_threads(),
+        },
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'baseline', 'save_baseline')},
+        'results': run_suite(args),
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        report['comparison'], regressions = compare(report['results'], baseline['results'], args.tolerance)
+        for name, ratio in report['comparison'].items():
+            print(f'{name:45} {ratio:6.2f}x{"  REGRESSION" if name in regressions else ""}', file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            file.write(output)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
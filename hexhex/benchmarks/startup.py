@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+measures how long entry points take to start, every measurement runs in a fresh interpreter
+python -m hexhex.benchmarks.startup [repetitions] [gtp]
+the GTP measurements are only run with gtp=1, they need config.ini with a [PLAY CLI] model in the working directory
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORTS = (
+    'hexhex.interactive.play_cli',
+    'hexhex.utils.logger',
+    'hexhex.utils.summary',
+    'hexhex.logic.hexboard',
+    'hexhex.training.train',
+)
+
+
+def import_seconds(module):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', f'import {module}'], check=True)
+    return time.perf_counter() - start
+
+
+def gtp_seconds():
+    """
+    returns the seconds until the engine answers protocol_version and until it answers genmove
+    the latter includes loading the model
+    raises RuntimeError if the engine exits or does not answer a command successfully
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'hexhex', 'gtp'], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+    def ask(command):
+        process.stdin.write(command + '\n')
+        process.stdin.flush()
+        answer = process.stdout.readline()
+        process.stdout.readline()
+        if not answer.startswith('=') or process.poll() is not None:
+            process.kill()
+            raise RuntimeError(f'the GTP engine did not answer {command}, is there a config.ini with a '
+                               f'[PLAY CLI] model?')
+        return answer
+
+    ask('protocol_version')
+    first_answer = time.perf_counter() - start
+    ask('genmove b')
+    first_move = time.perf_counter() - start
+    process.stdin.write('quit\n')
+    process.stdin.flush()
+    process.wait()
+    return first_answer, first_move
+
+
+def run(repetitions=3, gtp=False):
+    """
+    returns the median over repetitions of every measurement in seconds
+    """
+    results = {}
+    for module in IMPORTS:
+        results[f'import_{module}_seconds'] = statistics.median(import_seconds(module) for _ in range(repetitions))
+    if gtp:
+        answers = [gtp_seconds() for _ in range(repetitions)]
+        results['gtp_first_answer_seconds'] = statistics.median(answer for answer, _ in answers)
+        results['gtp_first_move_seconds'] = statistics.median(move for _, move in answers)
+    return results
+
+
+if __name__ == '__main__':
+    for key, value in run(*[int(argument) for argument in sys.argv[1:]]).items():
+        print(f'{key:50} {value:.3f}')
@@ -0,0 +1,43 @@
+"""
+benchmarks train_model on random positions, the loss values are meaningless
+"""
+from configparser import ConfigParser
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from hexhex.benchmarks.common import rate
+from hexhex.logic import hexboard
+from hexhex.training.train import train_model
+from hexhex.utils.utils import create_optimizer
+
+
+def random_samples(board_size, num_samples):
+    board = hexboard.Board(board_size)
+    board_states = board.board_tensor.unsqueeze(0).repeat(num_samples, 1, 1, 1)
+    board_states[:, :2, 1:-1, 1:-1] = (torch.rand(num_samples, 2, board_size, board_size) < 0.2).float()
+    moves = torch.randint(board_size ** 2, (num_samples, 1))
+    targets = torch.randint(2, (num_samples,)).float()
+    return board_states, moves, targets
+
+
+def training_samples_per_second(model, min_time, batch_size=256, num_batches=8):
+    config = ConfigParser()
+    config.read_dict({'TRAIN': {
+        'weight_decay': '0.0001',
+        'epochs': '1',
+        'print_loss_frequency': str(num_batches),
+    }})
+    samples = random_samples(model.board_size, batch_size * num_batches)
+    train_loader = DataLoader(TensorDataset(*samples), batch_size=batch_size, shuffle=True)
+    val_loader = DataLoader(TensorDataset(*[tensor[:batch_size] for tensor in samples]), batch_size=batch_size)
+    optimizer = create_optimizer('sgd', model.parameters(), learning_rate=0.01, momentum=0.9, weight_decay=0.0001)
+
+    def train():
+        train_model(model, train_loader, val_loader, optimizer, None, config['TRAIN'])
+        return len(train_loader.dataset)
+    return rate(train, min_time)
+
+
+def run(model, min_time):
+    return {'training_samples_per_second': training_samples_per_second(model, min_time)}
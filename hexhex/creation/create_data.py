@@ -2,17 +2,50 @@
 import numpy as np
 import torch
 
+from hexhex.creation.noise import game_seeds
+from hexhex.logic.adjudication import Adjudicator
 from hexhex.logic.hexboard import Board
 from hexhex.logic.hexgame import MultiHexGame
+from hexhex.logic.solver import Solver
+from hexhex.model import padding
 from hexhex.utils import utils
 from hexhex.utils.logger import logger
 
 
+def label_samples(solvers, board_states, moves, targets, max_empty):
+    """
+    labels the samples of each board size with the solver of that size,
+    board_states may hold boards of several sizes padded to a larger one
+    """
+    size = board_states.shape[-1] - 2
+    sizes = padding.board_sizes(board_states)
+    targets = targets.clone()
+    for board_size, solver in solvers.items():
+        selected = sizes == board_size
+        if not bool(selected.any()):
+            continue
+        size_moves = moves[selected] // size * board_size + moves[selected] % size
+        targets[selected] = solver.label(board_states[selected, :, :board_size + 2, :board_size + 2], size_moves,
+                                         targets[selected], max_empty)
+    return targets
+
+
 class SelfPlayGenerator:
-    def __init__(self, model, args):
+    """
+    with board_sizes the games of a batch cycle through these sizes, their positions are padded to the model size
+    """
+    def __init__(self, model, args, board_sizes=None):
         self.model = model
         self.args = args
         self.board_size = model.board_size
+        self.board_sizes = board_sizes or [self.board_size]
+        # with a seed the self-play games are reproducible
+        self.seed = args.getint('seed', fallback=None)
+        self.games_played = 0
+        # late positions are labelled with their exact result if solver_max_empty is set
+        self.solvers = {size: Solver.from_config(args, size) for size in self.board_sizes}
+        if None in self.solvers.values():
+            self.solvers = None
 
     def self_play_game(self):
         """
@@ -22,7 +55,10 @@ class SelfPlayGenerator:
         - move
         - result of game for active player
         """
-        boards = [Board(size=self.board_size) for _ in range(self.args.getint('batch_size'))]
+        batch_size = self.args.getint('batch_size')
+        boards = [Board(size=self.board_sizes[idx % len(self.board_sizes)]) for idx in range(batch_size)]
+        seeds = None if self.seed is None else game_seeds(self.seed, self.games_played, batch_size)
+        self.games_played += batch_size
         multihexgame = MultiHexGame(
             boards=boards,
             models=(self.model,),
@@ -30,9 +66,14 @@ class SelfPlayGenerator:
             noise_parameters=[float(parameter) for parameter in self.args.get('noise_parameters').split(",")],
             temperature=self.args.getfloat('temperature'),
             temperature_decay=self.args.getfloat('temperature_decay'),
-            gamma=self.args.getfloat('gamma')
+            gamma=self.args.getfloat('gamma'),
+            seeds=seeds,
+            adjudicator=Adjudicator.from_config(self.args)
         )
         board_states, moves, targets = multihexgame.play_moves()
+        if self.solvers is not None:
+            targets = label_samples(self.solvers, board_states, moves, targets, self.args.getint('solver_max_empty'))
+        board_states, moves = padding.pad_samples(board_states, moves, self.board_size)
         output_list = list(zip(board_states, moves, targets))
         np.random.shuffle(output_list)
 
@@ -45,12 +86,16 @@ class SelfPlayGenerator:
                 yield board_tensor, move_tensor, result_tensor
 
 
-def create_self_play_data(args, model, num_samples, verbose=True):
+def create_self_play_data(args, model, num_samples, verbose=True, board_sizes=None):
+    """
+    board_sizes are the sizes of the self-play games, model.board_size by default
+    boards of smaller sizes are padded to model.board_size, see padding
+    """
     if verbose:
         logger.info("")
         logger.info("=== creating data from self play ===")
 
-    self_play_generator = SelfPlayGenerator(model, args)
+    self_play_generator = SelfPlayGenerator(model, args, board_sizes)
     position_generator = self_play_generator.position_generator()
 
     board_size = model.board_size
@@ -65,9 +110,11 @@ def create_self_play_data(args, model, num_samples, verbose=True):
         all_results[sample_idx] = result
 
     if verbose:
+        inside = padding.cell_mask(padding.board_sizes(all_boards_tensor), board_size).unsqueeze(1)
+        num_stones = torch.ceil((all_boards_tensor[:, :, 1:-1, 1:-1] * inside).sum((1, 2, 3)))
+
         def k_th_move_idx(k):
-            return [idx for idx in range(all_boards_tensor.shape[0]) if np.ceil(torch.sum(
-                all_boards_tensor[idx, :, 1:-1, 1:-1])) == k]
+            return (num_stones == k).nonzero().view(-1).tolist()
 
         first_move_indices = k_th_move_idx(0)
         first_move_frequency = torch.zeros([board_size ** 2], dtype=torch.float)
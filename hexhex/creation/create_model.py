@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 
-import torch
-
-from hexhex.model import hexconvolution
+from hexhex.model import checkpoint, hexconvolution
 from hexhex.utils.logger import logger
 
 
@@ -16,7 +14,9 @@ def create_model(config, export_mode=False):
         layers=config.getint('layers'),
         intermediate_channels=config.getint('intermediate_channels'),
         reach=config.getint('reach'),
-        export_mode=export_mode
+        export_mode=export_mode,
+        distance_planes=config.getboolean('distance_planes', fallback=False),
+        size_biases=[int(size) for size in config.get('size_biases', fallback='').split(',') if size.strip()]
         )
 
     if not switch_model:
@@ -30,9 +30,5 @@ def create_model(config, export_mode=False):
 
 def create_and_store_model(config, name):
     model = create_model(config)
-    model_file = f'models/{name}.pt'
-    torch.save({
-        'model_state_dict': model.state_dict(),
-        'config': config
-        }, model_file)
+    model_file = checkpoint.save_model('models', name, model.state_dict(), config, {'generation': 0})
     logger.info(f'wrote {model_file}\n')
@@ -1,23 +1,84 @@
 import torch
-from torch.distributions.pareto import Pareto
 
-from hexhex.utils.utils import device
+MASK32 = 0xffffffff
 
+# independent streams of random numbers for the same game and ply
+STREAM_NOISE_CELL = 0
+STREAM_NOISE_VALUE = 1
+STREAM_DIRICHLET_NORMAL = 2
+STREAM_DIRICHLET_ANGLE = 3
+STREAM_DIRICHLET_BOOST = 4
+STREAM_GUMBEL = 5
 
-def singh_maddala_onto_output(output_tensor, noise_alpha, noise_beta, noise_lambda):
+
+def _mix32(x):
+    '''
+    finalizer of murmur3, x holds 32 bit values in an int64 tensor
+    '''
+    x = x ^ (x >> 16)
+    x = (x * 0x85ebca6b) & MASK32
+    x = x ^ (x >> 13)
+    x = (x * 0xc2b2ae35) & MASK32
+    return x ^ (x >> 16)
+
+
+def game_seeds(seed, first_game, num_games):
+    '''
+    seeds of the games first_game, ..., first_game + num_games - 1 of a run with the given seed
     '''
-    one value of the output_tensor gets increased by a sampled value of singh_maddala
+    games = torch.arange(first_game, first_game + num_games, dtype=torch.long) & MASK32
+    return _mix32(_mix32(torch.full_like(games, seed & MASK32)) ^ games)
+
+
+def hash_uniforms(seeds, plies, num_values, stream):
+    '''
+    uniform samples in (0, 1) of shape (len(seeds), num_values) which only depend on the seed of the game,
+    the ply and the stream, so games are reproducible independent of the batch they are played in
+    '''
+    key = _mix32(seeds.long() ^ _mix32((plies.long() * 0x9e3779b9 + stream * 0x7f4a7c15) & MASK32))
+    values = (torch.arange(num_values, dtype=torch.long, device=seeds.device) * 0x632be5ab) & MASK32
+    bits = _mix32(key.unsqueeze(1) ^ values.unsqueeze(0))
+    return (bits.double() + 0.5) / 2**32
+
+
+def singh_maddala_onto_output(output_tensor, noise_alpha, noise_beta, noise_lambda, cell_uniforms, value_uniforms):
+    '''
+    one value of each row of output_tensor gets increased by a sample of singh_maddala
     https://en.wikipedia.org/wiki/Burr_distribution
-    alpha=k, beta=c
+    alpha=k, beta=c, sampled by the inverse of the cumulative distribution function
+    cell_uniforms and value_uniforms hold one uniform sample per row
     '''
-    batch_size = output_tensor.shape[0]
-    output_tensor[torch.arange(0, batch_size).long(), torch.randint(torch.numel(output_tensor[0]), 
-        (batch_size,))] += noise_lambda*(Pareto(1, noise_alpha).sample((batch_size,)).to(device)-1)**(1/noise_beta)
-    return output_tensor
+    num_cells = output_tensor.shape[1]
+    cells = (cell_uniforms * num_cells).long().clamp(max=num_cells - 1)
+    values = noise_lambda * (value_uniforms ** (-1 / noise_alpha) - 1) ** (1 / noise_beta)
+    noise = torch.zeros_like(output_tensor)
+    noise.scatter_(1, cells.unsqueeze(1), values.unsqueeze(1).to(noise))
+    return output_tensor + noise
 
 
-def uniform_noise_onto_output(output_tensor, noise_p):
+def uniform_noise_onto_output(output_tensor, noise_p, uniforms):
     """
     Adds constant to each output value with probability noise_p
     """
-    return output_tensor + (torch.rand_like(output_tensor) < noise_p).type(torch.float) * 1000
+    return output_tensor + (uniforms < noise_p).type(output_tensor.dtype) * 1000
+
+
+def gamma_samples(alpha, normal_uniforms, angle_uniforms, boost_uniforms):
+    '''
+    approximate samples of Gamma(alpha, 1) from uniforms of equal shape
+    Gamma(alpha + 1) is approximated by Wilson-Hilferty with normals from Box-Muller
+    and multiplied by U**(1/alpha), which keeps the approximation accurate for small alpha
+    '''
+    normal = torch.sqrt(-2 * torch.log(normal_uniforms)) * torch.cos(2 * torch.pi * angle_uniforms)
+    shape = alpha + 1
+    cube = (1 - 1 / (9 * shape) + normal * (1 / (9 * shape)) ** 0.5).clamp(min=0) ** 3
+    return shape * cube * boost_uniforms ** (1 / alpha)
+
+
+def dirichlet_noise(legal, alpha, uniforms):
+    '''
+    samples of a symmetric Dirichlet distribution over the legal moves of each row
+    uniforms are the three uniform tensors of gamma_samples
+    '''
+    samples = gamma_samples(alpha, *uniforms).to(legal.dtype) * legal
+    return samples / samples.sum(1, keepdim=True).clamp(min=1e-30)
@@ -1,34 +1,139 @@
+import os
 from configparser import ConfigParser
 
 import torch
 
+from hexhex.creation.noise import game_seeds
 from hexhex.logic.hexboard import Board
 from hexhex.logic.hexgame import MultiHexGame
+from hexhex.logic.solver import Solver
 from hexhex.model.hexconvolution import RandomModel
+from hexhex.utils import utils
 from hexhex.utils.logger import logger
 
+# increase whenever the content of puzzle files changes, older files are recreated
+PUZZLE_VERSION = 2
+
+
+def puzzle_file(board_size, data_dir='data'):
+    return os.path.join(data_dir, f'{board_size}_puzzle.pt')
+
+
+def winning_cells(boards_tensor):
+    """
+    boolean tensor of the cells which immediately win for the player to move of each board tensor
+    """
+    board_size = boards_tensor.shape[-1] - 2
+    solver = Solver(board_size)
+    stones = (boards_tensor[:, :, 1:-1, 1:-1] > 0.5).flatten(2).tolist()
+    cells = torch.zeros(len(boards_tensor), board_size ** 2, dtype=torch.bool)
+    for idx, (mover_cells, opponent_cells) in enumerate(stones):
+        mover = sum(1 << cell for cell, stone in enumerate(mover_cells) if stone)
+        opponent = sum(1 << cell for cell, stone in enumerate(opponent_cells) if stone)
+        winning = solver.winning_cells(mover, solver.full & ~(mover | opponent), 0)
+        cells[idx] = torch.tensor([bool(winning >> cell & 1) for cell in range(board_size ** 2)])
+    return cells
+
 
 def create_puzzle(config):
+    """
+    plays num_samples games of RandomModel in batches of puzzle_batch_size and keeps the last two positions
+    of every game: the position before the winning move and the one before the last move of the loser
+    """
     logger.info("")
     logger.info("=== creating puzzle data from random model ===")
 
     board_size = config.getint('board_size')
+    num_games = config.getint('num_samples', 1000)
+    batch_size = config.getint('puzzle_batch_size', 1024)
+    seed = config.getint('puzzle_seed', 0)
     model = RandomModel(board_size=board_size)
 
-    all_boards_tensor = torch.Tensor()
-    all_moves = torch.LongTensor()
-    all_results = torch.Tensor()
-    for _ in range(config.getint('num_samples', 1000)):
-        multihexgame = MultiHexGame((Board(size=board_size),), (model,), temperature=1, 
-            temperature_decay=1, noise=None, noise_parameters=None)
+    boards_tensor = torch.zeros(2 * num_games, 2, board_size + 2, board_size + 2)
+    moves_tensor = torch.zeros(2 * num_games, 1, dtype=torch.long)
+    results_tensor = torch.zeros(2 * num_games)
+    for first_game in range(0, num_games, batch_size):
+        num_batch_games = min(batch_size, num_games - first_game)
+        multihexgame = MultiHexGame([Board(size=board_size) for _ in range(num_batch_games)], (model,),
+            temperature=1, temperature_decay=1, noise=None, noise_parameters=None,
+            seeds=game_seeds(seed, first_game, num_batch_games))
         board_states, moves, targets = multihexgame.play_moves()
-        all_boards_tensor = torch.cat((all_boards_tensor, board_states[-2:]))
-        all_moves = torch.cat((all_moves, moves[-2:]))
-        all_results = torch.cat((all_results, targets[-2:]))
 
-    filename = f'data/{board_size}_puzzle.pt'
-    torch.save((all_boards_tensor, all_moves, all_results), filename)
+        game_lengths = multihexgame.game_lengths()
+        mask = utils.ply_major_mask(game_lengths)
+        plies_to_end = (game_lengths.unsqueeze(0) - 1 - torch.arange(mask.shape[0]).unsqueeze(1))[mask]
+        last_plies = plies_to_end < 2
+        samples = slice(2 * first_game, 2 * (first_game + num_batch_games))
+        boards_tensor[samples] = board_states[last_plies]
+        moves_tensor[samples] = moves[last_plies]
+        results_tensor[samples] = targets[last_plies]
+
+    puzzle = {
+        'version': PUZZLE_VERSION,
+        'board_size': board_size,
+        'num_samples': num_games,
+        'seed': seed,
+        'boards': boards_tensor,
+        'moves': moves_tensor,
+        'results': results_tensor,
+        'winning_cells': winning_cells(boards_tensor),
+    }
+    filename = puzzle_file(board_size)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    torch.save(puzzle, filename)
     logger.info("Wrote " + filename)
+    return puzzle
+
+
+def load_puzzle(config):
+    """
+    returns the puzzle set of config['board_size'], it is created if the file is missing,
+    written by an older version or with different num_samples or puzzle_seed
+    """
+    filename = puzzle_file(config.getint('board_size'))
+    if os.path.exists(filename):
+        puzzle = torch.load(filename, map_location='cpu', weights_only=True)
+        if isinstance(puzzle, dict) and puzzle.get('version') == PUZZLE_VERSION and \
+                puzzle['board_size'] == config.getint('board_size') and \
+                puzzle['num_samples'] == config.getint('num_samples', 1000) and \
+                puzzle['seed'] == config.getint('puzzle_seed', 0):
+            return puzzle
+    return create_puzzle(config)
+
+
+def evaluate_puzzle(model, puzzle, criterion, batch_size=4096):
+    """
+    evaluates model on the puzzle set in batches of batch_size
+    returns the mean loss of criterion on the played moves,
+    value_accuracy: how often the sigmoid of the played move is on the side of 0.5 of its result
+    move_accuracy: how often the best move wins immediately in the positions where such a move exists
+    """
+    model.eval()
+    loss = 0.
+    value_hits = 0
+    move_hits = 0
+    num_winnable = 0
+    with torch.no_grad():
+        for start in range(0, len(puzzle['boards']), batch_size):
+            batch = slice(start, start + batch_size)
+            outputs = model(puzzle['boards'][batch].to(utils.device)).cpu()
+            values = torch.sigmoid(torch.gather(outputs, 1, puzzle['moves'][batch])).view(-1)
+            results = puzzle['results'][batch]
+            loss += criterion(values, results).item()
+            value_hits += ((values > 0.5) == (results > 0.5)).sum().item()
+
+            winning = puzzle['winning_cells'][batch]
+            winnable = winning.any(1)
+            best_moves = outputs.argmax(1, keepdim=True)
+            move_hits += (torch.gather(winning, 1, best_moves).view(-1) & winnable).sum().item()
+            num_winnable += winnable.sum().item()
+
+    num_samples = len(puzzle['boards'])
+    return {
+        'loss': loss / max(num_samples, 1),
+        'value_accuracy': value_hits / max(num_samples, 1),
+        'move_accuracy': move_hits / max(num_winnable, 1),
+    }
 
 
 def _main():
@@ -38,4 +143,4 @@ def _main():
 
 
 if __name__ == '__main__':
-    _main()
\ No newline at end of file
+    _main()
@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 import copy
+import itertools
 import math
+import statistics
+import sys
 from collections import defaultdict
+from configparser import ConfigParser
 
-from hexhex.evaluation import evaluate_two_models
-from hexhex.utils.utils import load_model
+import numpy as np
 
+from hexhex.elo import tournament
+from hexhex.elo.match import MatchDatabase
 
-def add_to_tournament(model_list, new_model_name, args, old_results):
+
+def add_to_tournament(model_list, new_model_name, args, old_results, database=None):
     """
     Adds new_model to existing tournament by playing against all other teams.
+    Matches already stored in database are not replayed, new matches are stored.
     """
 
     if old_results is None:
@@ -18,46 +25,153 @@ def add_to_tournament(model_list, new_model_name, args, old_results):
         new_results = copy.deepcopy(old_results)
 
     sub_model_names = model_list[:args.getint('max_num_opponents', fallback=10)]
-    new_model = load_model(f'models/{new_model_name}.pt')
+    pairs = [(old_model_file, new_model_name) for old_model_file in sub_model_names]
+    return tournament.play_pairs(pairs, args, database, new_results)
+
+
+def round_robin(model_names, args, database=None):
+    """
+    plays every pairing of model_names and returns the tournament table and its ratings
+    """
+    results = tournament.play_pairs(list(itertools.combinations(model_names, 2)), args, database)
+    return results, create_ratings(results)
+
+
+def results_to_matrix(results):
+    """
+    converts the nested results dict into a list of model names and a win matrix
+    wins[i, j] is the number of games model i won against model j
+    the first key of results comes first, as it anchors the ratings
+    """
+    names = list(results.keys())
+    for value in list(results.values()):
+        for name in value.keys():
+            if name not in results:
+                names.append(name)
+    names = list(dict.fromkeys(names))
+    index = {name: idx for idx, name in enumerate(names)}
 
-    for old_model_file in sub_model_names:
-        old_model = load_model(f'models/{old_model_file}.pt')
-        result, signed_chi_squared = evaluate_two_models.play_games(
-                models=(old_model, new_model),
-                num_opened_moves=args.getint('num_opened_moves'),
-                number_of_games=args.getint('number_of_games'),
-                batch_size=args.getint('batch_size'),
-                temperature=args.getfloat('temperature'),
-                temperature_decay=args.getfloat('temperature_decay'),
-                plot_board=args.getboolean('plot_board')
-        )
+    wins = np.zeros((len(names), len(names)))
+    for winner, value in list(results.items()):
+        for loser, count in list(value.items()):
+            wins[index[winner], index[loser]] += count
+    np.fill_diagonal(wins, 0)
+    return names, wins
 
-        new_results[old_model_file][new_model_name] = result[0][0] + result[1][0]
-        new_results[new_model_name][old_model_file] = result[0][1] + result[1][1]
 
-    return new_results
+def _sparse_pairs(wins):
+    # played pairs as (first, second, games) with first < second
+    games = np.triu(wins + wins.T, k=1)
+    first, second = np.nonzero(games)
+    return first, second, games[first, second]
 
 
-def create_ratings(results, runs=100):
-    # from https://en.wikipedia.org/wiki/Bradley-Terry_model
+def bradley_terry(wins, runs=100, tolerance=1e-10, prior=0.01, sparse=False, initial=None):
+    """
+    minorization-maximization iterations of the Bradley-Terry model on a win matrix
+    https://en.wikipedia.org/wiki/Bradley-Terry_model
+    prior adds virtual games between every pair of models (between played pairs if sparse) for numerical reasons
+    stops after runs iterations or once no log strength changes by more than tolerance
+    initial strengths can warm-start the iterations, e.g. from the previous ratings
+    models without games keep their initial strength, the mean strength by default
+    returns strengths normalized to sum 1
+    """
+    num_models = wins.shape[0]
 
-    all_models = set(results.keys())
-    for _, value in results.items():
-        for v in value.keys():
-            all_models.add(v)
+    if sparse:
+        first, second, games = _sparse_pairs(wins)
+        games = games + prior
+        degree = np.bincount(first, minlength=num_models) + np.bincount(second, minlength=num_models)
+        wins_sum = wins.sum(axis=1) + prior * degree
+    else:
+        games = wins + wins.T + prior
+        np.fill_diagonal(games, 0)
+        wins_sum = wins.sum(axis=1) + prior * num_models
+    played = (wins + wins.T).sum(axis=1) > 0
 
-    # + 0.01 for numerical reasons
-    results_sum = {x: sum(results[x][y] + 0.01 for y in all_models) for x in all_models}
-    p_list = results_sum.copy()
+    if initial is None:
+        p = wins_sum.copy()
+        p[~played] = p[played].mean() if played.any() else 1.
+    else:
+        p = np.array(initial, dtype=float)
+    p /= p.sum()
+    if not played.any():
+        return p
 
     for _ in range(runs):
-        inverse_p_list = {idx1: {idx2: (results[idx1][idx2]+results[idx2][idx1] + 0.01)/(p_list[idx1]+p_list[idx2])
-                           for idx2 in all_models if idx1 != idx2} for idx1 in all_models}
-        new_p_list = {idx: results_sum[idx]/sum(inverse_p_list[idx].values()) for idx in all_models}
-        sum_p_list = sum(new_p_list.values())
-        p_list = {p: new_p_list[p]/sum_p_list for p in new_p_list}
+        if sparse:
+            ratio = games / (p[first] + p[second])
+            denominator = np.bincount(first, ratio, num_models) + np.bincount(second, ratio, num_models)
+        else:
+            denominator = (games / (p[:, None] + p[None, :])).sum(axis=1)
+        new_p = p.copy()
+        new_p[played] = wins_sum[played] / denominator[played]
+        # the models with games keep their total strength, so the pinned models stay in place
+        new_p[played] *= p[played].sum() / new_p[played].sum()
+        change = np.abs(np.log(new_p[played]) - np.log(p[played])).max()
+        p = new_p
+        if change < tolerance:
+            break
+
+    return p
+
+
+def _initial_strengths(names, initial_ratings):
+    if initial_ratings is None:
+        return None
+    # models without a previous rating start at the mean rating
+    default = np.mean(list(initial_ratings.values())) if initial_ratings else 0.
+    return 10 ** (np.array([initial_ratings.get(name, default) for name in names]) / 400)
+
+
+def create_ratings(results, runs=100, tolerance=1e-10, sparse=False, initial_ratings=None):
+    """
+    Bradley-Terry ELO ratings of all models in results
+    the first model of results is rated 0
+    passing the previous ratings as initial_ratings recomputes them incrementally in a few iterations
+    """
+    names, wins = results_to_matrix(results)
+    p = bradley_terry(wins, runs=runs, tolerance=tolerance, sparse=sparse,
+        initial=_initial_strengths(names, initial_ratings))
+    elo_ratings = 400 * np.log10(p / p[0])
+    return {name: elo_ratings[idx].item() for idx, name in enumerate(names)}
+
+
+def create_ratings_with_intervals(results, confidence=0.95, runs=100, tolerance=1e-10, sparse=False):
+    """
+    same ratings as create_ratings plus the half width of their confidence intervals
+    intervals come from the inverse Fisher information of the log strengths relative to the first model
+    the interval of a model without games, or of all models if the first model has none, is infinite
+    """
+    names, wins = results_to_matrix(results)
+    p = bradley_terry(wins, runs=runs, tolerance=tolerance, sparse=sparse)
+    elo_ratings = 400 * np.log10(p / p[0])
+
+    games = wins + wins.T
+    information = -games * p[:, None] * p[None, :] / (p[:, None] + p[None, :]) ** 2
+    np.fill_diagonal(information, 0)
+    np.fill_diagonal(information, -information.sum(axis=1))
+
+    # the first model is the fixed reference, so its row and column are dropped
+    covariance = np.linalg.pinv(information[1:, 1:])
+    variances = np.concatenate(([0.], np.clip(np.diag(covariance), 0, None)))
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    half_widths = z * np.sqrt(variances) * 400 / math.log(10)
+    unplayed = games.sum(axis=1) == 0
+    half_widths[unplayed] = math.inf
+    if unplayed[0]:
+        half_widths[1:] = math.inf
+
+    ratings = {name: elo_ratings[idx].item() for idx, name in enumerate(names)}
+    intervals = {name: half_widths[idx].item() for idx, name in enumerate(names)}
+    return ratings, intervals
 
-    min_value = p_list[list(results.keys())[0]]
-    elo_ratings = {p: math.log10(p_list[p]/min_value)*400 for p in p_list}
 
-    return elo_ratings
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read('config.ini')
+    args = config['ELO']
+    results, ratings = round_robin(sys.argv[1:], args, MatchDatabase(config.get('REPEATED SELF TRAINING',
+        'match_database', fallback='data/matches.db')))
+    for model in sorted(ratings, key=ratings.get, reverse=True):
+        print('{:6} {}'.format(int(ratings[model]), model))
@@ -1,4 +1,9 @@
 #!/usr/bin/env python3
+import json
+import os
+import sqlite3
+from collections import defaultdict
+
 
 class MatchResults:
     def __init__(self, first_model_name, second_model_name, results):
@@ -29,3 +34,112 @@ class MatchResults:
                           f'[Result "{result_string}"]',
                           f'{result_string}',
                           ''])
+
+    def wins(self):
+        """
+        returns the number of games won by the first and by the second model
+        """
+        return self.results[0][0] + self.results[1][0], self.results[0][1] + self.results[1][1]
+
+    def add_to_table(self, table):
+        first_wins, second_wins = self.wins()
+        table[self.first_model][self.second_model] = first_wins
+        table[self.second_model][self.first_model] = second_wins
+        return table
+
+    def swapped(self):
+        """
+        same results seen from the second model
+        """
+        results = [[self.results[1][1], self.results[1][0]], [self.results[0][1], self.results[0][0]]]
+        return MatchResults(self.second_model, self.first_model, results)
+
+
+class MatchDatabase:
+    """
+    persistent sqlite store of played matches
+    a match is keyed by both model names, the modification time of their model files and the match settings
+    so a retrained model under an old name is never mixed up with its predecessor
+    results are stored as returned by evaluate_two_models.play_games
+    """
+    def __init__(self, path, model_dir='models'):
+        self.path = path
+        self.model_dir = model_dir
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS matches (
+            first TEXT, first_version REAL, second TEXT, second_version REAL, settings TEXT,
+            result00 INTEGER, result01 INTEGER, result10 INTEGER, result11 INTEGER,
+            PRIMARY KEY (first, first_version, second, second_version, settings))''')
+        self.connection.commit()
+
+    def model_version(self, model_name):
+        model_file = os.path.join(self.model_dir, f'{model_name}.pt')
+        return os.path.getmtime(model_file) if os.path.isfile(model_file) else 0.
+
+    @staticmethod
+    def settings_key(settings):
+        return json.dumps(settings, sort_keys=True)
+
+    def get(self, first_model, second_model, settings):
+        """
+        returns MatchResults of an already played match in the order of the arguments or None
+        """
+        settings_key = self.settings_key(settings)
+        first_version = self.model_version(first_model)
+        second_version = self.model_version(second_model)
+        query = '''SELECT result00, result01, result10, result11 FROM matches WHERE first = ? AND
+            first_version = ? AND second = ? AND second_version = ? AND settings = ?'''
+
+        row = self.connection.execute(query, (first_model, first_version, second_model, second_version,
+            settings_key)).fetchone()
+        if row is not None:
+            return MatchResults(first_model, second_model, [[row[0], row[1]], [row[2], row[3]]])
+
+        row = self.connection.execute(query, (second_model, second_version, first_model, first_version,
+            settings_key)).fetchone()
+        if row is not None:
+            return MatchResults(second_model, first_model, [[row[0], row[1]], [row[2], row[3]]]).swapped()
+        return None
+
+    def add(self, match_results, settings):
+        self.connection.execute('INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            match_results.first_model, self.model_version(match_results.first_model),
+            match_results.second_model, self.model_version(match_results.second_model),
+            self.settings_key(settings),
+            match_results.results[0][0], match_results.results[0][1],
+            match_results.results[1][0], match_results.results[1][1]))
+        self.connection.commit()
+
+    def all_matches(self, settings_list=None, model_names=None):
+        """
+        yields MatchResults of all matches between the current versions of their models,
+        optionally only those played with one of settings_list and between two of model_names
+        """
+        settings_keys = None if settings_list is None else set(self.settings_key(settings)
+                                                                for settings in settings_list)
+        versions = {}
+        rows = self.connection.execute('''SELECT first, first_version, second, second_version, settings,
+            result00, result01, result10, result11 FROM matches ORDER BY rowid''').fetchall()
+        for first, first_version, second, second_version, settings_key, *results in rows:
+            if settings_keys is not None and settings_key not in settings_keys:
+                continue
+            if model_names is not None and (first not in model_names or second not in model_names):
+                continue
+            for name in (first, second):
+                if name not in versions:
+                    versions[name] = self.model_version(name)
+            if versions[first] == first_version and versions[second] == second_version:
+                yield MatchResults(first, second, [results[:2], results[2:]])
+
+    def tournament_table(self, settings_list=None, model_names=None):
+        """
+        win counts of the matches selected like in all_matches in the format of
+        RepeatedSelfTrainer.tournament_results, a later match of a pair replaces an earlier one as in add_to_table
+        """
+        table = defaultdict(lambda: defaultdict(int))
+        for match_results in self.all_matches(settings_list, model_names):
+            match_results.add_to_table(table)
+        return table
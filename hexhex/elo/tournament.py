@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import multiprocessing
+import os
+from collections import defaultdict
+from configparser import ConfigParser
+
+from hexhex.elo.match import MatchResults
+from hexhex.evaluation import evaluate_two_models
+from hexhex.evaluation.sprt import SPRT
+from hexhex.logic.distance import DistanceModel
+from hexhex.model import registry
+from hexhex.model.hexconvolution import RandomModel
+from hexhex.utils.logger import logger
+
+# models without weights, created for the board size of their opponent
+HEURISTIC_MODELS = ('random', 'distance')
+
+# state of a tournament worker process, set by _init_worker
+_worker_args = None
+_worker_models = {}
+
+
+def match_settings(args):
+    """
+    the settings of args that influence match results, used as key of the MatchDatabase
+    """
+    settings = {
+        'num_opened_moves': args.getint('num_opened_moves'),
+        'number_of_games': args.getint('number_of_games'),
+        'temperature': args.getfloat('temperature'),
+        'temperature_decay': args.getfloat('temperature_decay'),
+    }
+    sprt = SPRT.from_config(args)
+    if sprt is not None:
+        settings.update(sprt.settings())
+    # matches between heuristic models are only told apart by the board size
+    if args.get('board_size', fallback=None):
+        settings['board_size'] = args.getint('board_size')
+    return settings
+
+
+def _args_section(args_dict):
+    config = ConfigParser()
+    config.read_dict({'TOURNAMENT': args_dict})
+    return config['TOURNAMENT']
+
+
+def _init_worker(args_dict, shared_models=None):
+    global _worker_args
+    _worker_args = _args_section(args_dict)
+    _worker_models.clear()
+    _worker_models.update(shared_models or {})
+
+
+def _get_model(model_name, board_size):
+    if model_name == 'random':
+        return RandomModel(board_size)
+    if model_name == 'distance':
+        return DistanceModel(board_size)
+    if model_name in _worker_models:
+        return _worker_models[model_name]
+    return registry.get_model(model_name)
+
+
+def _heuristic_pair(pair):
+    return all(model_name in HEURISTIC_MODELS for model_name in pair)
+
+
+def _board_size(pair, args):
+    """
+    heuristic models take the board size of their opponent, pairs of heuristic models the board_size of args
+    """
+    if _heuristic_pair(pair):
+        return args.getint('board_size')
+    return _get_model(pair[1] if pair[0] in HEURISTIC_MODELS else pair[0], None).board_size
+
+
+def _play_pair(pair):
+    first_model, second_model = pair
+    board_size = _board_size(pair, _worker_args)
+    result, _ = evaluate_two_models.play_games(
+        models=(_get_model(first_model, board_size), _get_model(second_model, board_size)),
+        num_opened_moves=_worker_args.getint('num_opened_moves'),
+        number_of_games=_worker_args.getint('number_of_games'),
+        batch_size=_worker_args.getint('batch_size'),
+        temperature=_worker_args.getfloat('temperature'),
+        temperature_decay=_worker_args.getfloat('temperature_decay'),
+        plot_board=_worker_args.getboolean('plot_board', False),
+        sprt=SPRT.from_config(_worker_args)
+    )
+    return MatchResults(first_model, second_model, result)
+
+
+def play_pairs(pairs, args, database=None, results=None):
+    """
+    plays all pairs of model names which are not stored in database yet
+    matches are distributed over a pool of num_workers processes
+    with share_memory (default) the models are loaded once and passed to the workers in shared memory,
+    otherwise each worker loads the models it needs
+    results are added to the tournament table results and stored in the database as soon as they arrive
+    """
+    if results is None:
+        results = defaultdict(lambda: defaultdict(int))
+
+    settings = match_settings(args)
+    pending = []
+    for first_model, second_model in pairs:
+        match_results = None if database is None else database.get(first_model, second_model, settings)
+        if match_results is None:
+            pending.append((first_model, second_model))
+        else:
+            match_results.add_to_table(results)
+
+    if pending == []:
+        return results
+    for pair in pending:
+        if _heuristic_pair(pair) and not args.get('board_size', fallback=None):
+            raise ValueError(f'{pair[0]} - {pair[1]}: matches between heuristic models need a board_size setting')
+
+    def add_result(match_results):
+        match_results.add_to_table(results)
+        if database is not None:
+            database.add(match_results, settings)
+        first_wins, second_wins = match_results.wins()
+        logger.debug(f'{match_results.first_model} - {match_results.second_model}: {first_wins} : {second_wins}')
+
+    args_dict = dict(args)
+    num_workers = min(len(pending), args.getint('num_workers', fallback=max(1, (os.cpu_count() or 1) // 4)))
+    if num_workers <= 1:
+        _init_worker(args_dict)
+        for pair in pending:
+            add_result(_play_pair(pair))
+        return results
+
+    shared_models = {}
+    if args.getboolean('share_memory', fallback=True):
+        shared_models = {model_name: registry.get_model(model_name, share_memory=True)
+                         for model_name in set(model_name for pair in pending for model_name in pair)
+                         if model_name not in HEURISTIC_MODELS}
+
+    context = multiprocessing.get_context(args.get('start_method', fallback='spawn'))
+    with context.Pool(num_workers, initializer=_init_worker, initargs=(args_dict, shared_models)) as pool:
+        for match_results in pool.imap_unordered(_play_pair, pending):
+            add_result(match_results)
+    return results
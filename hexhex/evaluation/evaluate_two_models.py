@@ -1,39 +1,51 @@
 #!/usr/bin/env python
-import random
 from configparser import ConfigParser
 from time import gmtime, strftime
 
+from hexhex.evaluation.sprt import SPRT
 from hexhex.logic import hexboard
-from hexhex.logic.hexgame import MultiHexGame
+from hexhex.logic.hexgame import MultiHexGame, MultiOpponentHexGame
+from hexhex.logic.openings import get_opening_book
+from hexhex.model.hexconvolution import RandomModel
 from hexhex.utils.logger import logger
 from hexhex.utils.utils import load_model
 from hexhex.visualization.image import draw_board_image
 
 
-def play_games(models, num_opened_moves, number_of_games, batch_size, temperature, temperature_decay, plot_board, verbose=False):
+def play_games(models, num_opened_moves, number_of_games, batch_size, temperature, temperature_decay, plot_board,
+        verbose=False, sprt=None):
+    """
+    plays number_of_games games with each model starting
+    the games are played in batches alternating the starting model
+    with num_opened_moves the openings are drawn from the opening book in proportion to their weights,
+    so the number of games is not capped by the size of the book
+    if an SPRT is given, no more batches are played once it has reached a decision
+    """
     assert(len(models) == 2)
     assert(models[0].board_size == models[1].board_size)
     board_size = models[0].board_size
 
     if num_opened_moves > 0:
-        openings = list(hexboard.first_k_moves(board_size, num_opened_moves))
-        random.shuffle(openings)
-        number_of_games = min(len(openings), number_of_games)
+        opening_book = get_opening_book(board_size, num_opened_moves)
+        openings = opening_book.sample(number_of_games)
 
     logger.debug(f'playing {number_of_games} games')
 
     time = strftime("%Y-%m-%d_%H-%M-%S", gmtime())
     result = [[0, 0], [0, 0]]
+    game_numbers = [0, 0]
 
     logger.debug(f'    M1 - M2')
-    for starting_model in range(2):
-        game_number = 0
-
-        while game_number < number_of_games:
+    for batch_start in range(0, number_of_games, batch_size):
+        for starting_model in range(2):
             ordered_models = models[::-1] if starting_model^(num_opened_moves%2) else models
+            first_outputs = None
             if num_opened_moves > 0:
-                batch_of_openings = openings[game_number:game_number + batch_size]
-                boards = [hexboard.get_opened_board(board_size, opening) for opening in batch_of_openings]
+                batch_of_openings = openings[batch_start:batch_start + batch_size]
+                boards = opening_book.boards(batch_of_openings)
+                # outputs of a random model must not be reused
+                if not isinstance(ordered_models[0], RandomModel):
+                    first_outputs = opening_book.evaluate(ordered_models[0], batch_of_openings)
             else:
                 boards = [hexboard.Board(size=board_size) for idx in range(batch_size)]
             multihexgame = MultiHexGame(
@@ -43,16 +55,26 @@ def play_games(models, num_opened_moves, number_of_games, batch_size, temperatur
                     noise_parameters=None,
                     temperature=temperature,
                     temperature_decay=temperature_decay,
+                    first_outputs=first_outputs
             )
             multihexgame.play_moves()
             for board in multihexgame.boards:
                 winning_model = board.winner[0] if starting_model == 0 else 1 - board.winner[0]
                 result[starting_model][winning_model] += 1
                 if plot_board:
+                    game_number = game_numbers[starting_model]
                     draw_board_image(board.board_tensor,
                         f'data/images/{time}_{starting_model}_{game_number:04d}.png')
                     board.export_as_FF4(f'images/{time}_{starting_model}_{game_number:04d}.txt')
-                game_number += 1
+                game_numbers[starting_model] += 1
+
+        if sprt is not None:
+            status = sprt.result_status(result)
+            if status is not None:
+                logger.debug(f'SPRT accepted {status} after {sum(game_numbers)} games')
+                break
+
+    for starting_model in range(2):
         color_model1 = 'B' if starting_model == 0 else 'W'
         color_model2 = 'W' if starting_model == 0 else 'B'
         if verbose:
@@ -67,6 +89,65 @@ def play_games(models, num_opened_moves, number_of_games, batch_size, temperatur
     return result, signed_chi_squared
 
 
+def play_against_opponents(model, opponents, num_opened_moves, number_of_games, batch_size, temperature,
+        temperature_decay, sprt=None):
+    """
+    plays model against every model of the dict opponents in shared batches of MultiOpponentHexGame
+    each batch contains batch_size games per opponent and starting model, so the model evaluates
+    the positions of all opponents in one forward pass
+    openings are drawn like in play_games
+    if an SPRT is given, opponents are dropped from later batches once their SPRT has reached a decision
+    returns a dict of results in the format of play_games
+    """
+    board_size = model.board_size
+    assert(all(opponent.board_size == board_size for opponent in opponents.values()))
+
+    if num_opened_moves > 0:
+        opening_book = get_opening_book(board_size, num_opened_moves)
+        openings = opening_book.sample(number_of_games)
+
+    opponent_names = list(opponents.keys())
+    results = {name: [[0, 0], [0, 0]] for name in opponent_names}
+    undecided = opponent_names[:]
+
+    for batch_start in range(0, number_of_games, batch_size):
+        num_games = min(batch_size, number_of_games - batch_start)
+        boards, opponent_indices, model_seats = [], [], []
+        for opponent_idx, opponent_name in enumerate(opponent_names):
+            if opponent_name not in undecided:
+                continue
+            for model_seat in range(2):
+                for game_idx in range(num_games):
+                    if num_opened_moves > 0:
+                        boards.append(opening_book.board(openings[batch_start + game_idx]))
+                    else:
+                        boards.append(hexboard.Board(size=board_size))
+                    opponent_indices.append(opponent_idx)
+                    model_seats.append(model_seat)
+
+        game = MultiOpponentHexGame(
+            boards,
+            model,
+            [opponents[name] for name in opponent_names],
+            opponent_indices,
+            model_seats,
+            temperature=temperature,
+            temperature_decay=temperature_decay
+        )
+        game.play_moves()
+
+        for board, opponent_idx, model_seat in zip(boards, opponent_indices, model_seats):
+            winning_model = 0 if board.winner[0] == model_seat else 1
+            results[opponent_names[opponent_idx]][model_seat][winning_model] += 1
+
+        if sprt is not None:
+            undecided = [name for name in undecided if sprt.result_status(results[name]) is None]
+            if undecided == []:
+                break
+
+    return results
+
+
 def evaluate(config_file):
     logger.info("")
     logger.info("=== evaluating two models ===")
@@ -84,7 +165,8 @@ def evaluate(config_file):
             temperature=config.getfloat('EVALUATE MODELS', 'temperature'),
             temperature_decay=config.getfloat('EVALUATE MODELS', 'temperature_decay'),
             plot_board=config.getboolean('EVALUATE MODELS', 'plot_board'),
-            verbose=True
+            verbose=True,
+            sprt=SPRT.from_config(config['EVALUATE MODELS'])
         )
 
 
@@ -0,0 +1,57 @@
+import math
+
+
+def elo_to_win_probability(elo_difference):
+    return 1 / (1 + 10 ** (-elo_difference / 400))
+
+
+class SPRT:
+    '''
+    sequential probability ratio test on the win rate of the first model https://en.wikipedia.org/wiki/Sequential_probability_ratio_test
+    H0: the first model is elo0 ELO stronger than the second model, H1: it is elo1 ELO stronger
+    alpha and beta are the error probabilities of accepting H1 and H0 wrongly
+    hex has no draws, so the games are Bernoulli trials
+    '''
+    def __init__(self, elo0=0., elo1=50., alpha=0.05, beta=0.05):
+        self.p0 = elo_to_win_probability(elo0)
+        self.p1 = elo_to_win_probability(elo1)
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+
+    @classmethod
+    def from_config(cls, config):
+        '''
+        returns None unless sprt is enabled in the config section
+        '''
+        if not config.getboolean('sprt', False):
+            return None
+        return cls(
+            elo0=config.getfloat('sprt_elo0', 0.),
+            elo1=config.getfloat('sprt_elo1', 50.),
+            alpha=config.getfloat('sprt_alpha', 0.05),
+            beta=config.getfloat('sprt_beta', 0.05)
+        )
+
+    def settings(self):
+        return {'sprt_p0': self.p0, 'sprt_p1': self.p1,
+                'sprt_bounds': [self.lower_bound, self.upper_bound]}
+
+    def llr(self, wins, losses):
+        return wins * math.log(self.p1 / self.p0) + losses * math.log((1 - self.p1) / (1 - self.p0))
+
+    def status(self, wins, losses):
+        '''
+        returns 'H1' if the first model is stronger, 'H0' if it is not and None if more games are needed
+        '''
+        llr = self.llr(wins, losses)
+        if llr >= self.upper_bound:
+            return 'H1'
+        if llr <= self.lower_bound:
+            return 'H0'
+        return None
+
+    def result_status(self, result):
+        '''
+        same as status for a result of evaluate_two_models.play_games
+        '''
+        return self.status(result[0][0] + result[1][0], result[0][1] + result[1][1])
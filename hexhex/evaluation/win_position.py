@@ -1,80 +1,130 @@
-import itertools
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import torch
 
+from hexhex.elo.match import MatchResults
 from hexhex.evaluation import evaluate_two_models
-from hexhex.logic.hexboard import Board
-from hexhex.logic.hexgame import MultiHexGame
+from hexhex.evaluation.sprt import SPRT
+from hexhex.logic.distance import DistanceModel
+from hexhex.logic.hexboard import Board, to_move
+from hexhex.logic.solver import SearchLimitExceeded, Solver
+from hexhex.model import registry
+from hexhex.model.hexconvolution import RandomModel
 from hexhex.utils.logger import logger
 from hexhex.utils.summary import writer
+from hexhex.utils import utils
 from hexhex.utils.utils import load_model
 
 
-class TestModel:
-    def __init__(self, move_ids):
-        self.move_ids = move_ids
+def model_move(model, board):
+    with torch.no_grad():
+        outputs = model(board.board_tensor.unsqueeze(0).to(utils.device))
+    position1d = outputs.argmax(1).item()
+    return to_move(utils.correct_position1d(position1d, board.size, board.player), board.size)
 
-    def __call__(self, x):
-        y = x[0]
-        possible_moves = (1 - y[0] - y[1]).view(-1)
-        num_moves = int(sum((y[0] + y[1]).view(-1)))
-        move = self.move_ids[num_moves//2]
-        out = torch.zeros_like(y[0].view(-1))
-        move_idx = possible_moves.nonzero()[move]
-        out[move_idx] = 1000
-        return out.unsqueeze(0)
 
-
-def win_count_3(model_name):
+def verify_model(model_name, max_positions=10000, max_nodes=None):
+    """
+    checks the model against every reply of an opponent in both seats on a small board:
+    in each position the model is to move and wins with perfect play, its best move has to keep the win
+    positions are searched breadth first up to max_positions, positions the solver gives up on are skipped
+    returns the number of won positions the model gave away and the number of checked positions
+    """
     model = load_model(f'models/{model_name}.pt')
-    board_size = model.board_size
-
-    lose_count = 0
-    game_count = 0
-
-    for test_model_starts in [True, False]:
-        if test_model_starts:
-            move_generator = [[0, 1, 7, 8]] + [range(x) for x in [7, 5, 3, 1]]
-        else:
-            move_generator = [range(x) for x in [8, 6, 4, 2]]
-        for xs in itertools.product(*move_generator):
-            board = Board(board_size)
-            counter_model = TestModel(xs)
-            models = (counter_model, model) if test_model_starts else (model, counter_model)
-            game = MultiHexGame((board,), models, noise=None, noise_parameters=None, 
-                temperature=0, temperature_decay=0)
-            game.play_moves()
-            if board.winner == [1 - int(test_model_starts)]:
-                lose_count += 1
-            game_count += 1
-    logger.info(f"Lost {lose_count} / {game_count} games")
-
-
-def win_count(model_name, reference_models, config, verbose):
+    solver = Solver(model.board_size, max_nodes=max_nodes)
+
+    mistakes = 0
+    checked = 0
+    seen = set()
+    queue = deque((Board(model.board_size), model_seat) for model_seat in (0, 1))
+    while queue and checked < max_positions:
+        board, model_seat = queue.popleft()
+        if board.winner:
+            continue
+        seat = 1 - board.player if board.switch else board.player
+        if seat == model_seat:
+            move = model_move(model, board)
+            try:
+                if solver.solve(board) == seat:
+                    checked += 1
+                    if move not in solver.winning_moves(board):
+                        mistakes += 1
+            except SearchLimitExceeded:
+                pass
+            queue.append((board.set_stone_immutable(move), model_seat))
+            continue
+        for move in sorted(board.legal_moves):
+            next_board = board.set_stone_immutable(move)
+            key = (tuple(solver.bitboards(next_board)), next_board.player, next_board.switch, model_seat)
+            if key not in seen:
+                seen.add(key)
+                queue.append((next_board, model_seat))
+    logger.info(f"Gave away {mistakes} / {checked} won positions")
+    return mistakes, checked
+
+
+def load_reference_model(model_name, board_size):
+    if model_name == "random":
+        return RandomModel(board_size)
+    if model_name == "distance":
+        return DistanceModel(board_size)
+    return registry.get_model(model_name)
+
+
+def match_settings(config):
+    """
+    the settings of config that influence match results, used as key of the MatchDatabase
+    """
+    settings = {
+        'num_opened_moves': config.getint('num_opened_moves', 1),
+        'number_of_games': config.getint('num_games', 100) // 2,
+        'temperature': config.getfloat('temperature', 0),
+        'temperature_decay': config.getfloat('temperature_decay', 0),
+    }
+    sprt = SPRT.from_config(config)
+    if sprt is not None:
+        settings.update(sprt.settings())
+    return settings
+
+
+def win_count(model_name, reference_model_names, config, verbose, board_size, database=None):
+    """
+    plays model_name against all reference models at once, matches stored in database are not replayed
+    """
     if verbose:
         logger.info("Determining win count against test model")
 
-    model = load_model(f'models/{model_name}.pt')
-    board_size = model.board_size
     results = defaultdict(lambda: defaultdict(int))
+    settings = match_settings(config)
+
+    match_results = {}
+    if database is not None:
+        for opponent_name in reference_model_names:
+            match_results[opponent_name] = database.get(model_name, opponent_name, settings)
+
+    pending = [name for name in reference_model_names if match_results.get(name) is None]
+    if pending != []:
+        opponents = {opponent_name: load_reference_model(opponent_name, board_size) for opponent_name in pending}
+        played = evaluate_two_models.play_against_opponents(
+            model=load_reference_model(model_name, board_size),
+            opponents=opponents,
+            num_opened_moves=settings['num_opened_moves'],
+            number_of_games=settings['number_of_games'],
+            batch_size=config.getint('batch_size', 32),
+            temperature=settings['temperature'],
+            temperature_decay=settings['temperature_decay'],
+            sprt=SPRT.from_config(config)
+        )
+        for opponent_name, result in played.items():
+            match_results[opponent_name] = MatchResults(model_name, opponent_name, result)
+            if database is not None:
+                database.add(match_results[opponent_name], settings)
 
     total_lose_count = 0
     total_game_count = 0
 
-    for opponent_name, opponent_model in reference_models.items():
-        result, _ = evaluate_two_models.play_games(
-            models=(model, opponent_model),
-            num_opened_moves=config.getint('num_opened_moves', 1),
-            number_of_games=config.getint('num_games', 100) // 2,
-            batch_size=config.getint('batch_size', 32),
-            temperature=config.getfloat('temperature', 0),
-            temperature_decay=config.getfloat('temperature_decay', 0),
-            plot_board=config.getboolean('plot_board', False)
-        )
-
-        results[model_name][opponent_name] = result[0][0] + result[1][0]
-        results[opponent_name][model_name] = result[0][1] + result[1][1]
+    for opponent_name in reference_model_names:
+        match_results[opponent_name].add_to_table(results)
 
         lose_count = results[opponent_name][model_name]
         game_count = results[model_name][opponent_name] + results[opponent_name][model_name]
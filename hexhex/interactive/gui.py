@@ -2,6 +2,8 @@ import math
 
 import pygame
 
+from hexhex.logic.topology import topology
+
 # Define the colors we will use in RGB format
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -60,13 +62,24 @@ class Gui:
         exit(0)
 
     def pixel_to_pos(self, pixel):
-        positions = [(x, y) for x in range(self.board.size) for y in range(self.board.size)]
-
-        def squared_distance(pos1, pos2):
-            return (pos1[0] - pos2[0]) ** 2 + (pos1[1] - pos2[1]) ** 2
-
-        centers = [(position, self.get_center(position)) for position in positions]
-        return min(centers, key=lambda x: squared_distance(x[1], pixel))[0]
+        """
+        inverts get_center to find the nearest cell, then walks to neighbours as long as they are closer
+        """
+        size = self.board.size
+        x = (pixel[1] - 2*self.r) / (math.sqrt(3) / 2 * self.r)
+        y = (pixel[0] - 2*self.r - x * self.r / 2) / self.r
+        position = (min(max(round(x), 0), size - 1), min(max(round(y), 0), size - 1))
+
+        def squared_distance(pos):
+            center = self.get_center(pos)
+            return (center[0] - pixel[0]) ** 2 + (center[1] - pixel[1]) ** 2
+
+        neighbour_positions = topology(size).neighbour_positions
+        while True:
+            closest = min(neighbour_positions[position], key=squared_distance)
+            if squared_distance(closest) >= squared_distance(position):
+                return position
+            position = closest
 
     def get_center(self, pos):
         x = pos[0]
@@ -1,66 +1,198 @@
 #!/usr/bin/env python3
 import logging
 import sys
+import threading
+import time
 from configparser import ConfigParser
 
-from hexhex.logic import hexboard
-from hexhex.logic.hexgame import MultiHexGame
-from hexhex.utils.utils import load_model
+from hexhex.utils.lazy import LazyModule
+
+# torch and the model are loaded in the background, so the engine answers the first commands right away
+np = LazyModule('numpy')
+torch = LazyModule('torch')
+hexboard = LazyModule('hexhex.logic.hexboard')
+hexgame = LazyModule('hexhex.logic.hexgame')
+mcts = LazyModule('hexhex.model.mcts')
+utils = LazyModule('hexhex.utils.utils')
 
 logging.basicConfig(level=logging.DEBUG, filename='play_cli.log', filemode='w')
 
 
+class GtpError(Exception):
+    pass
+
 
 class CliGame:
+    '''
+    GTP/HTP engine https://www.lysator.liu.se/~gunnar/gtp/
+    the model is loaded once and kept for all games
+    in mode mcts each move is searched for a time budget derived from time_settings and time_left,
+    otherwise the raw policy of the model is played
+    the model is loaded in a background thread, commands which need it wait until it is ready
+    '''
+    static_commands = {'protocol_version', 'name', 'version', 'known_command', 'list_commands', 'time_settings',
+                       'time_left', 'quit'}
+
     def __init__(self, config):
         self.config = config['PLAY CLI']
         self.board = None
         self.switch = self.config.getboolean('switch', True)
-        self.model = load_model(f'models/{self.config.get("model")}.pt')
+        self.model = None
+        self.mode = self.config.get('mode', 'nomcts')
+        self.main_time = None
+        self.byo_yomi_time = 0.
+        self.byo_yomi_stones = 0
+        self.time_left = {}
+        self.commands = {
+            'protocol_version': lambda args: '2',
+            'name': lambda args: 'HexHex',
+            'version': lambda args: '0.0',
+            'known_command': lambda args: 'true' if args and args[0] in self.commands else 'false',
+            'list_commands': lambda args: '\n'.join(self.commands),
+            'boardsize': self.boardsize,
+            'clear_board': lambda args: self.new_game(self.board.size),
+            'play': self.play,
+            'genmove': self.genmove,
+            'undo': self.undo,
+            'showboard': lambda args: str(self.board.logical_board_tensor[0]-self.board.logical_board_tensor[1]),
+            'final_score': self.final_score,
+            'time_settings': self.time_settings,
+            'time_left': self.set_time_left,
+            'quit': self.quit,
+        }
+        self.loaded = threading.Event()
+        self.load_error = None
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def load(self):
+        try:
+            self.model = utils.load_model(f'models/{self.config.get("model")}.pt')
+            self.new_game(self.model.board_size)
+            self.warm_up()
+        except Exception as error:
+            logging.exception('loading the model failed')
+            self.load_error = error
+        finally:
+            self.loaded.set()
+
+    def wait_for_model(self):
+        self.loaded.wait()
+        if self.load_error is not None:
+            raise GtpError(f'cannot load model: {self.load_error}')
 
+    def warm_up(self):
+        # the first forward pass allocates buffers, do it before the clock runs
+        with torch.no_grad():
+            self.model(self.board.board_tensor.unsqueeze(0).to(utils.device))
+
+    def new_game(self, size):
+        self.board = hexboard.Board(size, self.switch)
+        self.game = hexgame.MultiHexGame(
+                boards=(self.board,),
+                models=(self.model,),
+                noise=None,
+                noise_parameters=None,
+                temperature=self.config.getfloat('temperature', 0.),
+                temperature_decay=self.config.getfloat('temperature_decay', 1.),
+        )
+        return ''
 
     def respond(self, line):
-        splitted = line.split(' ')
-        if splitted[0] == 'name':
-            return 'HexHex'
-        if splitted[0] == 'version':
-            return '0.0'
-        if splitted[0] == 'list_commands':
-            return 'final_score'
-        if splitted[0] == 'boardsize':
-            self.board = hexboard.Board(int(splitted[1]), self.switch)
-            self.game = MultiHexGame(
-                    boards=(self.board,),
-                    models=(self.model,),
-                    noise=None,
-                    noise_parameters=None,
-                    temperature=self.config.getfloat('temperature', 0.),
-                    temperature_decay=self.config.getfloat('temperature_decay', 1.),
-            )
+        splitted = line.split()
+        if splitted == []:
+            return ''
+        if splitted[0] not in self.commands:
+            raise GtpError('unknown command')
+        if splitted[0] not in self.static_commands:
+            self.wait_for_model()
+        return self.commands[splitted[0]](splitted[1:])
+
+    def boardsize(self, args):
+        size = int(args[0])
+        if size != self.model.board_size:
+            raise GtpError('unacceptable size')
+        return self.new_game(size)
+
+    def play(self, args):
+        position = args[1]
+        if position == 'resign':
             return ''
-        if splitted[0] == 'showboard':
-            return str(self.board.logical_board_tensor[0]-self.board.logical_board_tensor[1])
-        if splitted[0] == 'play':
-            color = splitted[1]
-            position = splitted[2]
-            if splitted[2] != 'resign':
-                y = ord(position[0]) - ord('a')
-                x = int(position[1:]) - 1
-                logging.debug(f'interpreted move at {x}{y}')
-                self.board.set_stone((x, y))
-        if splitted[0] == 'genmove':
-            if self.board.winner:
-                return 'resign'
+        if position in ['swap', 'swap-pieces']:
+            if len(self.board.made_moves) != 1:
+                raise GtpError('illegal move')
+            move = next(iter(self.board.made_moves))
+        else:
+            move = hexboard.alpha_numeric_to_position(position)
+        if move not in self.board.legal_moves:
+            raise GtpError('illegal move')
+        logging.debug(f'interpreted move at {move}')
+        self.board.set_stone(move)
+        return ''
+
+    def genmove(self, args):
+        if self.board.winner:
+            return 'resign'
+        color = args[0].lower()[0] if args else 'b'
+        start = time.perf_counter()
+        if self.mode == 'mcts':
+            budget = self.move_time(color)
+            simulation = mcts.Simulation(self.model, self.config, self.board)
+            move_counts, simulations = simulation.run_for(budget,
+                max_simulations=self.config.getint('num_mcts_simulations', fallback=None))
+            move1d = int(np.argmax(move_counts))
+            self.board.set_stone(utils.correct_position1d(move1d, self.board.size, self.board.player))
+            latency = time.perf_counter() - start
+            logging.info(f'genmove: {simulations} simulations in {latency:.3f}s of {budget:.3f}s budget, '
+                         f'{simulations / latency:.1f} nodes/s')
+        else:
             self.game.batched_single_move(self.model)
-            move = self.board.move_history[-1][1]
-            alpha, numeric = hexboard.position_to_alpha_numeric(move)
-            logging.debug(f'moving to {move}')
-            return f'{alpha}{numeric}'
-        if splitted[0] == 'final_score':
-            winner = 'B' if self.board.winner[0] == 0 else 'W'
-            return f'{winner}+'
-        if splitted[0] == 'quit':
-            exit(0)
+            latency = time.perf_counter() - start
+            logging.info(f'genmove: latency {latency:.3f}s')
+        if color in self.time_left:
+            self.time_left[color] -= latency
+
+        move = self.board.move_history[-1][1]
+        alpha, numeric = hexboard.position_to_alpha_numeric(move)
+        logging.debug(f'moving to {move}')
+        return f'{alpha}{numeric}'
+
+    def move_time(self, color):
+        '''
+        spreads the remaining time evenly over the moves the engine is still expected to make
+        plus the byo-yomi time per stone
+        '''
+        time_left = self.time_left.get(color)
+        if time_left is None:
+            return self.config.getfloat('move_time', 1.)
+        expected_moves = max(len(self.board.legal_moves) // 4, self.config.getint('min_expected_moves', 10))
+        budget = time_left / expected_moves
+        if self.byo_yomi_stones > 0:
+            budget += self.byo_yomi_time / self.byo_yomi_stones
+        return max(budget - self.config.getfloat('time_safety_margin', 0.05), 0.)
+
+    def time_settings(self, args):
+        self.main_time, self.byo_yomi_time, self.byo_yomi_stones = float(args[0]), float(args[1]), int(args[2])
+        self.time_left = {'b': self.main_time, 'w': self.main_time}
+        return ''
+
+    def set_time_left(self, args):
+        self.time_left[args[0].lower()[0]] = float(args[1])
+        return ''
+
+    def undo(self, args):
+        if self.board.move_history == []:
+            raise GtpError('cannot undo')
+        self.board.undo_move_board()
+        return ''
+
+    def final_score(self, args):
+        if not self.board.winner:
+            raise GtpError('game is not over')
+        winner = 'B' if self.board.winner[0] == 0 else 'W'
+        return f'{winner}+'
+
+    def quit(self, args):
+        exit(0)
 
 
 def main():
@@ -72,9 +204,13 @@ def main():
         logging.info(f'reading input')
         line = input()
         logging.info(f'input: {line}')
-        answer = game.respond(line)
+        try:
+            answer = game.respond(line)
+            print(f'= {answer}\n')
+        except (GtpError, IndexError, ValueError) as error:
+            answer = f'? {error}'
+            print(f'{answer}\n')
         logging.info(f'output: {answer}')
-        print(f'= {answer}\n')
         sys.stdout.flush()
 
 
@@ -0,0 +1,140 @@
+from functools import lru_cache
+
+import torch
+
+from hexhex.creation import noise
+from hexhex.logic.topology import topology
+
+START = -1
+END = -2
+STREAM_CALIBRATION = 16
+
+
+@lru_cache(maxsize=None)
+def bridges(board_size):
+    '''
+    for each cell the cells it forms a bridge with and the two cells between them, its carrier
+    '''
+    neighbours = topology(board_size).neighbour_positions
+    table = {}
+    for cell in topology(board_size).positions:
+        partners = set(other for neighbour in neighbours[cell] for other in neighbours[neighbour])
+        partners -= neighbours[cell] | {cell}
+        table[cell] = [(partner, frozenset(neighbours[cell] & neighbours[partner])) for partner in partners
+                       if len(neighbours[cell] & neighbours[partner]) == 2]
+    return table
+
+
+def _edge_carrier(cell, layer, edge_row, board_size, made_moves):
+    '''
+    the two empty cells which connect a stone on the second row to its edge, None if there are none
+    '''
+    carrier = frozenset(neighbour for neighbour in topology(board_size).neighbour_positions[cell]
+                        if neighbour[layer] == edge_row)
+    if len(carrier) == 2 and carrier.isdisjoint(made_moves):
+        return carrier
+    return None
+
+
+def virtually_connected(board, layer, max_steps=2000):
+    '''
+    whether the stones of layer connect both of its edges through a chain of groups which are joined by bridges
+    and edge templates with pairwise disjoint carriers, such a chain can not be cut whoever is to move
+    the search is conservative: it gives up after max_steps and does not know larger templates
+    '''
+    size = board.size
+    groups = [stones for stones, _ in board.connected_sets[layer]]
+    if sum(len(stones) for stones in groups) < (size - 1) // 2:
+        return False
+    owner = {cell: group for group, stones in enumerate(groups) for cell in stones}
+    made_moves = board.made_moves
+    bridge_table = bridges(size)
+
+    links = {START: [], END: []}
+    for group, stones in enumerate(groups):
+        links.setdefault(group, [])
+        for cell in stones:
+            if cell[layer] == 0:
+                links[START].append((group, frozenset()))
+            if cell[layer] == size - 1:
+                links[group].append((END, frozenset()))
+            if cell[layer] == 1:
+                carrier = _edge_carrier(cell, layer, 0, size, made_moves)
+                if carrier is not None:
+                    links[START].append((group, carrier))
+            if cell[layer] == size - 2:
+                carrier = _edge_carrier(cell, layer, size - 1, size, made_moves)
+                if carrier is not None:
+                    links[group].append((END, carrier))
+            for partner, carrier in bridge_table[cell]:
+                if partner in owner and owner[partner] != group and carrier.isdisjoint(made_moves):
+                    links[group].append((owner[partner], carrier))
+    for node_links in links.values():
+        node_links.sort(key=lambda link: len(link[1]))
+
+    steps = 0
+
+    def search(node, used, visited):
+        nonlocal steps
+        if node == END:
+            return True
+        steps += 1
+        if steps > max_steps:
+            return False
+        for next_node, carrier in links[node]:
+            if next_node in visited or not used.isdisjoint(carrier):
+                continue
+            visited.add(next_node)
+            if search(next_node, used | carrier, visited):
+                return True
+            visited.discard(next_node)
+        return False
+
+    return search(START, frozenset(), {START})
+
+
+def declare_winner(board, layer):
+    '''
+    ends the game as won by the player of layer, board.winner refers to seats like in Board.set_stone
+    '''
+    board.winner = [1 - layer] if board.switch else [layer]
+    board.legal_moves = set()
+
+
+class Adjudicator:
+    '''
+    ends self-play games early
+    virtual_connections ends a game as soon as the player who just moved is virtually connected
+    the player to move resigns if the sigmoid of its best output is below resign_threshold, 0 disables resigning
+    in a calibration_fraction of the games, chosen by their seeds, nothing is adjudicated, instead the first ply
+    where it would have happened is recorded to measure wrong decisions and the plies adjudication saves
+    '''
+    def __init__(self, virtual_connections=True, resign_threshold=0., calibration_fraction=0.):
+        self.virtual_connections = virtual_connections
+        self.resign_threshold = resign_threshold
+        self.calibration_fraction = calibration_fraction
+
+    @staticmethod
+    def from_config(args):
+        '''
+        returns None unless adjudicate is set in args
+        '''
+        if not args.getboolean('adjudicate', fallback=False):
+            return None
+        return Adjudicator(
+            virtual_connections=args.getboolean('adjudicate_virtual_connections', fallback=True),
+            resign_threshold=args.getfloat('resign_threshold', fallback=0.),
+            calibration_fraction=args.getfloat('resign_disabled_fraction', fallback=0.),
+        )
+
+    def calibration_games(self, seeds):
+        zeros = torch.zeros(len(seeds), dtype=torch.long)
+        return noise.hash_uniforms(seeds, zeros, 1, STREAM_CALIBRATION)[:, 0] < self.calibration_fraction
+
+    def resigns(self, outputs_tensor):
+        '''
+        boolean tensor, True for the boards whose player to move resigns
+        '''
+        if self.resign_threshold <= 0:
+            return torch.zeros(len(outputs_tensor), dtype=torch.bool)
+        return (torch.sigmoid(outputs_tensor.max(1)[0]) < self.resign_threshold).cpu()
@@ -0,0 +1,199 @@
+from collections import deque
+
+import torch
+import torch.nn as nn
+
+from hexhex.logic.topology import topology
+from hexhex.model import padding
+
+INF = 10**6
+
+EMPTY = 0
+OWN = 1
+OPPONENT = 2
+
+
+def cell_states(board, layer):
+    '''
+    flat list of EMPTY, OWN and OPPONENT from the view of the player of layer
+    '''
+    states = [EMPTY] * board.size ** 2
+    for player in (0, 1):
+        state = OWN if player == layer else OPPONENT
+        for stones, _ in board.connected_sets[player]:
+            for x, y in stones:
+                states[x * board.size + y] = state
+    return states
+
+
+def shortest_distances(states, board_size, layer, end=False):
+    '''
+    0-1 breadth first search from an edge of the player of layer, own stones cost 0, empty cells 1,
+    opponent stones block, returns for every cell the number of empty cells on the cheapest path to it
+    '''
+    table = topology(board_size).neighbours
+    distances = [INF] * board_size ** 2
+    queue = deque()
+    for cell in topology(board_size).edge_cells[layer][end]:
+        if states[cell] != OPPONENT:
+            distances[cell] = 0 if states[cell] == OWN else 1
+            if states[cell] == OWN:
+                queue.appendleft(cell)
+            else:
+                queue.append(cell)
+    while queue:
+        cell = queue.popleft()
+        distance = distances[cell]
+        for neighbour in table[cell]:
+            state = states[neighbour]
+            if state == OPPONENT:
+                continue
+            new_distance = distance if state == OWN else distance + 1
+            if new_distance < distances[neighbour]:
+                distances[neighbour] = new_distance
+                if state == OWN:
+                    queue.appendleft(neighbour)
+                else:
+                    queue.append(neighbour)
+    return distances
+
+
+def connection_distance(states, board_size, layer):
+    '''
+    number of empty cells the player of layer needs at least to connect, 0 if connected, INF if impossible
+    '''
+    distances = shortest_distances(states, board_size, layer)
+    return min(distances[cell] for cell in topology(board_size).edge_cells[layer][1])
+
+
+def _extended_neighbours(states, board_size):
+    '''
+    empty neighbours of every empty cell, where own groups act as a single cell
+    '''
+    table = topology(board_size).neighbours
+    group_empties = {}
+    group_of = {}
+    for cell, state in enumerate(states):
+        if state != OWN or cell in group_of:
+            continue
+        group, empties, stack = len(group_empties), set(), [cell]
+        group_of[cell] = group
+        while stack:
+            stone = stack.pop()
+            for neighbour in table[stone]:
+                if states[neighbour] == EMPTY:
+                    empties.add(neighbour)
+                elif states[neighbour] == OWN and neighbour not in group_of:
+                    group_of[neighbour] = group
+                    stack.append(neighbour)
+        group_empties[group] = empties
+    extended = {}
+    for cell, state in enumerate(states):
+        if state != EMPTY:
+            continue
+        neighbours = set()
+        for neighbour in table[cell]:
+            if states[neighbour] == EMPTY:
+                neighbours.add(neighbour)
+            elif states[neighbour] == OWN:
+                neighbours |= group_empties[group_of[neighbour]]
+        neighbours.discard(cell)
+        extended[cell] = neighbours
+    return extended, group_of, group_empties
+
+
+def two_distances(states, board_size, layer, end=False):
+    '''
+    two-distance of every empty cell to an edge of the player of layer: one more than the second smallest
+    two-distance of its neighbours, as the opponent can always block the best one
+    cells touching the edge, directly or through an own group, have distance 1, other cells INF
+    '''
+    extended, group_of, group_empties = _extended_neighbours(states, board_size)
+    distances = [INF] * board_size ** 2
+    edge = set()
+    for cell in topology(board_size).edge_cells[layer][end]:
+        if states[cell] == EMPTY:
+            edge.add(cell)
+        elif states[cell] == OWN:
+            edge |= group_empties[group_of[cell]]
+
+    buckets = [list(edge)]
+    for cell in edge:
+        distances[cell] = 1
+    finalized_neighbours = [0] * board_size ** 2
+    level = 0
+    while level < len(buckets):
+        for cell in buckets[level]:
+            for neighbour in extended[cell]:
+                finalized_neighbours[neighbour] += 1
+                if finalized_neighbours[neighbour] == 2 and distances[neighbour] == INF:
+                    distances[neighbour] = level + 2
+                    if len(buckets) <= level + 1:
+                        buckets.append([])
+                    buckets[level + 1].append(neighbour)
+        level += 1
+    return distances
+
+
+def potentials(states, board_size, layer):
+    '''
+    sum of the two-distances of every empty cell to both edges, the minimum is the potential of the player
+    '''
+    start = two_distances(states, board_size, layer)
+    end = two_distances(states, board_size, layer, end=True)
+    return [min(first + second, INF) for first, second in zip(start, end)]
+
+
+def board_distances(board):
+    '''
+    connection distances of the players of layer 0 and layer 1 of a Board
+    '''
+    return tuple(connection_distance(cell_states(board, layer), board.size, layer) for layer in (0, 1))
+
+
+def tensor_states(board_tensor):
+    '''
+    cell states from the view of the player to move of a board_tensor of shape (2, size+2, size+2),
+    the player to move has its stones in channel 0 and connects the first dimension
+    '''
+    stones = (board_tensor[:, 1:-1, 1:-1] > 0.5).flatten(1)
+    return (stones[0].long() * OWN + stones[1].long() * OPPONENT).tolist()
+
+
+def distance_planes(boards_tensor, normalization=None):
+    '''
+    two-distance potentials of the player to move and of its opponent for a batch of board tensors,
+    as planes of the same spatial shape with zero border, scaled to [0, 1] where 0 means INF
+    padded boards of several sizes are evaluated within their own size
+    '''
+    padded_size = boards_tensor.shape[-1] - 2
+    planes = torch.zeros(len(boards_tensor), 2, padded_size + 2, padded_size + 2)
+    sizes = padding.board_sizes(boards_tensor).tolist()
+    for idx, (board_tensor, board_size) in enumerate(zip(boards_tensor.cpu(), sizes)):
+        scale = normalization or 2 * board_size
+        states = tensor_states(board_tensor[:, :board_size + 2, :board_size + 2])
+        for plane, (player_states, layer) in enumerate([(states, 0), ([
+                {EMPTY: EMPTY, OWN: OPPONENT, OPPONENT: OWN}[state] for state in states], 1)]):
+            values = torch.tensor(potentials(player_states, board_size, layer), dtype=torch.float)
+            values = (1 - values / scale).clamp(min=0) * (values < INF)
+            planes[idx, plane, 1:board_size + 1, 1:board_size + 1] = values.view(board_size, board_size)
+    return planes.to(boards_tensor.device)
+
+
+class DistanceModel(nn.Module):
+    '''
+    heuristic opponent without weights: prefers empty cells with small two-distance potentials for both players,
+    i.e. cells on the shortest connections of the player to move and of its opponent
+    illegal moves are handled like in RandomModel, so the switch is offered as a regular move
+    '''
+    def __init__(self, board_size):
+        super(DistanceModel, self).__init__()
+        self.board_size = board_size
+
+    def forward(self, x, sizes=None):
+        size = x.shape[-1] - 2
+        sizes = padding.board_sizes(x) if sizes is None else sizes
+        illegal = padding.illegal_moves(x) + padding.outside_moves(sizes, size)
+        planes = distance_planes(x[:, :2])
+        ratings = (planes[:, 0, 1:-1, 1:-1] + planes[:, 1, 1:-1, 1:-1]).reshape(-1, size**2)
+        return 10 * ratings - illegal
@@ -1,7 +1,9 @@
 import copy
+import math
 
 import torch
 
+from hexhex.logic.topology import topology
 from hexhex.utils.logger import logger
 
 
@@ -15,30 +17,14 @@ def position_to_alpha_numeric(position):
     x, y = position
     return chr(97 + y), x + 1
 
-def get_neighbours(position, size):
-    x = int(position[0])
-    y = int(position[1])
-
-    assert 0 <= x < size
-    assert 0 <= y < size
-
-    neighbours = set([(x-1, y), (x-1, y+1), (x, y-1), (x, y+1), (x+1, y-1), (x+1, y)])
-
-    if x == 0:
-        neighbours.discard((x-1, y))
-        neighbours.discard((x-1, y+1))
-    elif x == size-1:
-        neighbours.discard((x+1, y-1))
-        neighbours.discard((x+1, y))
+def alpha_numeric_to_position(move_string):
+    return int(move_string[1:]) - 1, ord(move_string[0].lower()) - ord('a')
 
-    if y == 0:
-        neighbours.discard((x, y-1))
-        neighbours.discard((x+1, y-1))
-    elif y == size-1:
-        neighbours.discard((x-1, y+1))
-        neighbours.discard((x, y+1))
-
-    return neighbours
+def get_neighbours(position, size):
+    """
+    a new set of the positions next to position, see topology for the shared precomputed tables
+    """
+    return set(topology(size).neighbour_positions[int(position[0]), int(position[1])])
 
 
 def update_connected_sets_check_win(connected_sets, player, position, size):
@@ -55,7 +41,7 @@ def update_connected_sets_check_win(connected_sets, player, position, size):
     elif player == 1:
         new_connected_set = (set([position]), set([position[1]]))
 
-    neighbours = get_neighbours(position, size)
+    neighbours = topology(size).neighbour_positions[position]
 
     for connected_set in connected_sets:
         if not connected_set[0].isdisjoint(neighbours):
@@ -79,13 +65,16 @@ class Board:
     First player has to connect his stones on the first dimension (displayed top to bottom), second player on the second dimension (displayed left to right).
     If the second player decides to switch, a stone is set in the second layer that is only information.
     The second player becomes the first player and now plays the first layer and vice-versa.
+    The input of the models is kept in views: views[0] is the board with border as seen by the first layer,
+    views[1] the same board rolled and transposed as seen by the second layer. Every stone updates one cell of each,
+    board_tensor is the view of the player to move. views can live in a larger tensor, see attach_views.
     """
     def __init__(self, size, switch_allowed=True):
         self.size = size
         self.logical_board_tensor = torch.zeros([2, self.size, self.size])
-        self.board_tensor = self.set_border(self.logical_board_tensor)
+        self.views = self.initial_views()
         self.made_moves = set()
-        self.legal_moves = set([(idx1, idx2) for idx1 in range(self.size) for idx2 in range(self.size)])
+        self.legal_moves = set(topology(size).positions)
         self.connected_sets = [[], []]
         self.player = 0
         self.switch = False
@@ -95,7 +84,11 @@ class Board:
 
     def override(self, other):
         self.size = other.size
-        self.board_tensor = other.board_tensor
+        # copied into the existing views, they may be part of the shared views of a MultiHexGame
+        if self.views.shape == other.views.shape:
+            self.views.copy_(other.views)
+        else:
+            self.views = other.views
         self.logical_board_tensor = other.logical_board_tensor
         self.made_moves = other.made_moves
         self.legal_moves = other.legal_moves
@@ -103,6 +96,7 @@ class Board:
         self.player = other.player
         self.switch = other.switch
         self.winner = other.winner
+        self.switch_allowed = other.switch_allowed
         self.move_history = other.move_history
 
     def __repr__(self):
@@ -112,6 +106,32 @@ class Board:
             +'\nWinner\n'+str(self.winner)
             +'\nConnected sets\n'+str(self.connected_sets))+'\n'
 
+    @property
+    def board_tensor(self):
+        return self.views[self.player]
+
+    def initial_views(self):
+        normal = self.set_border(self.logical_board_tensor)
+        return torch.stack((normal, torch.transpose(torch.roll(normal, 1, 0), 1, 2)))
+
+    def attach_views(self, views):
+        """
+        copies the views into the given tensor of shape (2, 2, size+2, size+2) and updates it from now on
+        """
+        views.copy_(self.views)
+        self.views = views
+
+    def set_cell(self, layer, position, value):
+        """
+        sets a cell of logical_board_tensor and the corresponding cells of both views
+        """
+        x, y = position
+        # numpy writes of single cells are much cheaper than tensor indexing, the memory is shared
+        self.logical_board_tensor.numpy()[layer, x, y] = value
+        views = self.views.numpy()
+        views[0, layer, x + 1, y + 1] = value
+        views[1, 1 - layer, y + 1, x + 1] = value
+
     def set_border(self, board_tensor):
         border = torch.zeros([2, self.size+2, self.size+2])
         border[0, 0, 1:-1] = 1
@@ -121,12 +141,31 @@ class Board:
         border[:, 1:-1, 1:-1] = board_tensor
         return border
 
+    def clone(self):
+        """
+        Returns an independent copy of the board, much faster than copy.deepcopy.
+        """
+        other = Board.__new__(Board)
+        other.size = self.size
+        other.logical_board_tensor = self.logical_board_tensor.clone()
+        other.views = self.views.clone()
+        other.made_moves = set(self.made_moves)
+        other.legal_moves = set(self.legal_moves)
+        other.connected_sets = [[(set(stones), set(indices)) for stones, indices in player_sets]
+                                for player_sets in self.connected_sets]
+        other.player = self.player
+        other.switch = self.switch
+        other.winner = copy.copy(self.winner)
+        other.switch_allowed = self.switch_allowed
+        other.move_history = list(self.move_history)
+        return other
+
     def set_stone_immutable(self, position):
         """
         Same as set_stone but does not alter the board.
-        Instead it returns a modified deep copy of the board with the stone set.
+        Instead it returns a modified copy of the board with the stone set.
         """
-        self_copy = copy.deepcopy(self)
+        self_copy = self.clone()
         self_copy.set_stone(position)
         return self_copy
 
@@ -143,9 +182,7 @@ class Board:
                 if set([position]) == self.made_moves:
                     self.switch = True
                     self.legal_moves.remove(position)
-                    self.logical_board_tensor[1][position] = 0.001
-                    self.board_tensor = torch.transpose(torch.roll(self.set_border(
-                        self.logical_board_tensor), 1, 0), 1, 2)
+                    self.set_cell(1, position, 0.001)
                     self.move_history.append((self.player, position))
                     return
 
@@ -155,10 +192,10 @@ class Board:
 
             elif len(self.made_moves) == 0 and not self.switch_allowed:
                 self.legal_moves.remove(position)
-                self.logical_board_tensor[1][position] = 0.001
+                self.set_cell(1, position, 0.001)
 
             self.made_moves.update([position])
-            self.logical_board_tensor[self.player][position] = 1
+            self.set_cell(self.player, position, 1)
             self.connected_sets[self.player], self.winner = update_connected_sets_check_win( \
                 self.connected_sets[self.player], self.player, position, self.size)
             self.move_history.append((self.player, position))
@@ -169,11 +206,6 @@ class Board:
                 self.legal_moves = set()
 
             self.player = 1-self.player
-            if self.player:
-                self.board_tensor = torch.transpose(torch.roll(self.set_border(
-                    self.logical_board_tensor), 1, 0), 1, 2)
-            else:
-                self.board_tensor = self.set_border(self.logical_board_tensor)
 
         else:
             logger.error(f'Illegal Move! {position} of type {type(position)}')
@@ -205,14 +237,14 @@ class Board:
             print(")", file=file)
 
     def undo_move_board(self):
-        new_board = Board(self.size)
+        new_board = Board(self.size, switch_allowed=self.switch_allowed)
         for move in self.move_history[:-1]:
             new_board.set_stone(move[1])
         self.override(new_board)
 
 
 def all_moves(board_size):
-    return [(x, y) for x in range(board_size) for y in range(board_size)]
+    return list(topology(board_size).positions)
 
 def first_k_moves(board_size, num_moves):
     if num_moves == 1:
@@ -229,3 +261,34 @@ def get_opened_board(board_size, opening):
     for position in opening:
         board.set_stone(position)
     return board
+
+def rotate_move(move, board_size):
+    """
+    180° rotation, which maps every position onto an equivalent one
+    """
+    return board_size - 1 - move[0], board_size - 1 - move[1]
+
+def _normal_opening(opening):
+    # moves of the same player may be reordered, except for the first two moves of a switch
+    prefix = opening[:2] if len(opening) > 1 and opening[0] == opening[1] else []
+    rest = opening[len(prefix):]
+    first, second = sorted(rest[0::2]), sorted(rest[1::2])
+    normal = prefix + [None] * len(rest)
+    normal[len(prefix)::2] = first
+    normal[len(prefix)+1::2] = second
+    return normal, math.factorial(len(first)) * math.factorial(len(second))
+
+def canonical_first_k_moves(board_size, num_moves):
+    """
+    yields (opening, weight) for one representative of every position reachable by first_k_moves
+    positions are identified under reordering the moves of each player and under 180° rotation
+    weight is the number of move sequences of first_k_moves leading to the position or its rotation
+    """
+    for opening in first_k_moves(board_size, num_moves):
+        normal, num_orders = _normal_opening(opening)
+        if normal != opening:
+            continue
+        rotated, _ = _normal_opening([rotate_move(move, board_size) for move in opening])
+        if rotated < normal:
+            continue
+        yield opening, num_orders * (1 if rotated == normal else 2)
@@ -1,18 +1,105 @@
 import torch
 import torch.nn as nn
-from torch.distributions.categorical import Categorical
 
-from hexhex.creation.noise import singh_maddala_onto_output, uniform_noise_onto_output
+from hexhex.creation import noise as noise_module
+from hexhex.logic import adjudication
+from hexhex.model import padding
 from hexhex.utils import utils
+from hexhex.utils.profiling import timer
 
 
-def tempered_moves_selection(output_tensor, temperature):
-    #samples with softmax from unnormalized values (if temp>0) and selects move
-    if temperature < 10**(-10):
-        return output_tensor.argmax(1)
-    else:
-        temperature_output = output_tensor/temperature
-        return Categorical(logits=temperature_output).sample()
+class MoveSelector:
+    '''
+    selects one move per game from a batch of model outputs in a single pass of tensor operations
+    the temperature of each game is temperature * temperature_decay**(number of moves made in that game)
+    noise is None, 'singh' (alpha, beta, lambda), 'uniform' (probability) or 'dirichlet' (alpha, epsilon),
+    Dirichlet noise is mixed into the tempered move probabilities like in AlphaZero
+    moves are sampled with the Gumbel-max trick, all random numbers are derived from the seed of the game
+    and the ply, so a game played with the same seed is reproduced in any batch
+    '''
+    def __init__(self, noise, noise_parameters, temperature, temperature_decay):
+        self.noise = noise
+        self.noise_parameters = noise_parameters
+        self.temperature = temperature
+        self.temperature_decay = temperature_decay
+
+    def select(self, outputs_tensor, move_counts, seeds, plies):
+        uniforms = lambda num_values, stream: noise_module.hash_uniforms(seeds, plies, num_values, stream).to(
+            outputs_tensor.device)
+        num_cells = outputs_tensor.shape[1]
+
+        if self.noise == 'singh':
+            noise_alpha, noise_beta, noise_lambda = self.noise_parameters
+            outputs_tensor = noise_module.singh_maddala_onto_output(outputs_tensor, noise_alpha, noise_beta,
+                noise_lambda, uniforms(1, noise_module.STREAM_NOISE_CELL)[:, 0],
+                uniforms(1, noise_module.STREAM_NOISE_VALUE)[:, 0])
+        if self.noise == 'uniform':
+            noise_probability, = self.noise_parameters
+            outputs_tensor = noise_module.uniform_noise_onto_output(outputs_tensor, noise_probability,
+                uniforms(num_cells, noise_module.STREAM_NOISE_VALUE))
+
+        temperatures = (self.temperature * self.temperature_decay ** move_counts.to(outputs_tensor)).unsqueeze(1)
+        sampled = temperatures > 10**(-10)
+        logits = outputs_tensor / temperatures.clamp(min=10**(-10))
+
+        if self.noise == 'dirichlet':
+            noise_alpha, noise_epsilon = self.noise_parameters
+            legal = (outputs_tensor > -900).to(outputs_tensor.dtype)
+            dirichlet = noise_module.dirichlet_noise(legal, noise_alpha, [uniforms(num_cells, stream) for stream in (
+                noise_module.STREAM_DIRICHLET_NORMAL, noise_module.STREAM_DIRICHLET_ANGLE,
+                noise_module.STREAM_DIRICHLET_BOOST)])
+            probabilities = torch.softmax(logits, 1)
+            logits = torch.log((1 - noise_epsilon) * probabilities + noise_epsilon * dirichlet)
+
+        # in double precision, as uniforms close to 1 round to 1 in single precision
+        gumbel = -torch.log(-torch.log(uniforms(num_cells, noise_module.STREAM_GUMBEL))).to(logits.dtype)
+        return (logits + gumbel * sampled).argmax(1)
+
+
+def default_seeds(num_games):
+    # drawn from the torch generator, so torch.manual_seed makes games reproducible
+    return torch.randint(2**31, (num_games,), dtype=torch.long)
+
+
+def shared_views(boards):
+    '''
+    moves the input views of all boards into one tensor of shape (len(boards), 2, 2, size+2, size+2)
+    boards smaller than the largest size are padded, see padding
+    '''
+    size = max(board.size for board in boards)
+    views = torch.zeros(len(boards), 2, 2, size + 2, size + 2)
+    for idx, board in enumerate(boards):
+        board.attach_views(views[idx, :, :, :board.size + 2, :board.size + 2])
+    return views
+
+
+def gather_inputs(boards, board_indices, views=None):
+    '''
+    the board tensors of the boards with the given indices padded to the largest size,
+    a single indexing operation with shared views
+    '''
+    if views is None:
+        size = max(board.size for board in boards)
+        return torch.stack([padding.pad_board_tensor(boards[idx].board_tensor, size) for idx in board_indices])
+    players = torch.tensor([boards[idx].player for idx in board_indices], dtype=torch.long)
+    return views[torch.tensor(board_indices, dtype=torch.long), players]
+
+
+def board_sizes(boards):
+    '''
+    the sizes of the boards as tensor, which the models take for batches of several sizes, None for a single size
+    '''
+    if len(set(board.size for board in boards)) <= 1:
+        return None
+    return torch.tensor([board.size for board in boards], dtype=torch.long)
+
+
+def board_position(board, position1d, padded_size):
+    '''
+    the position on board of a move selected from padded outputs for the player to move
+    '''
+    x, y = divmod(position1d, padded_size)
+    return utils.correct_position1d(x * board.size + y, board.size, board.player)
 
 
 class MultiHexGame():
@@ -23,64 +110,195 @@ class MultiHexGame():
     noise can be added after elo to boost random moves, noise and noise_parameters control the type of noise
     temperature controls move selection from the predictions from 0 (take best prediction) to large positive number (take any move)
     temperature_decay decays the temperature over time as a power function with base:temperature_decay and exponent:number of moves made
+    both are applied per board, see MoveSelector
+    seeds holds one integer seed per board, random numbers for noise and sampling only depend on it and the ply
+    first_outputs can hold the already known outputs of the first model for all boards, e.g. from an OpeningBook
+    adjudicator can end games early by resignation or virtual connection, see adjudication.Adjudicator
+    with share_views the inputs of all boards are kept in one tensor, see shared_views
     '''
-    def __init__(self, boards, models, noise, noise_parameters, temperature, temperature_decay, gamma=1):
+    def __init__(self, boards, models, noise, noise_parameters, temperature, temperature_decay, gamma=1,
+            first_outputs=None, seeds=None, adjudicator=None, share_views=True):
         torch.set_num_threads(4)
         self.boards = boards
-        self.board_size = self.boards[0].size
+        self.views = shared_views(boards) if share_views else None
+        # boards of several sizes are padded to the largest one
+        self.board_size = max(board.size for board in boards)
+        self.sizes = board_sizes(boards)
         self.batch_size = len(boards)
         self.models = [nn.DataParallel(model).to(utils.device) for model in models]
-        self.noise = noise
-        self.noise_parameters = noise_parameters
-        self.temperature = temperature
-        self.temperature_decay = temperature_decay
+        self.move_selector = MoveSelector(noise, noise_parameters, temperature, temperature_decay)
+        self.seeds = default_seeds(self.batch_size) if seeds is None else seeds
         self.output_boards_tensor = torch.Tensor(device='cpu')
         self.positions_tensor = torch.LongTensor(device='cpu')
         self.gamma = gamma
+        self.first_outputs = first_outputs
+        # boards may start with opening moves, only positions reached in this game are recorded
+        self.start_lengths = torch.tensor([len(board.move_history) for board in boards], dtype=torch.long)
+        self.adjudicator = adjudicator
+        if adjudicator is not None:
+            self.calibration = adjudicator.calibration_games(self.seeds).tolist()
+            self.calibration_triggers = {}
 
     def __repr__(self):
         return ''.join([str(board) for board in self.boards])
 
+    def game_lengths(self):
+        return torch.tensor([len(board.move_history) for board in self.boards], dtype=torch.long) - \
+            self.start_lengths
+
     def play_moves(self):
         while True:
             for model in self.models:
                 self.batched_single_move(model)
                 if self.current_boards == []:
+                    if self.adjudicator is not None:
+                        self.count_calibration()
                     self.positions_tensor = self.positions_tensor.view(-1, 1)
-                    targets = utils.get_targets(self.boards, self.gamma)
+                    targets = utils.get_targets(self.game_lengths(), self.gamma)
                     return self.output_boards_tensor, self.positions_tensor, targets
 
     def batched_single_move(self, model):        
-        self.current_boards = []
-        self.current_boards_tensor = torch.Tensor()
-        for board_idx in range(self.batch_size):
-            if self.boards[board_idx].winner == False:
-                self.current_boards.append(board_idx)
-                self.current_boards_tensor = torch.cat((self.current_boards_tensor, self.boards[board_idx].board_tensor.unsqueeze(0)))
-
-        if self.current_boards == []:
-            return
-        
+        with timer.stage('game_board'):
+            self.current_boards = [board_idx for board_idx in range(self.batch_size)
+                                   if self.boards[board_idx].winner == False]
+            if self.current_boards == []:
+                return
+            self.current_boards_tensor = gather_inputs(self.boards, self.current_boards, self.views)
+
+        with timer.stage('game_model'):
+            outputs_tensor, positions1d = self.select_moves(model)
+
+        with timer.stage('game_board'):
+            if self.adjudicator is not None:
+                moving = torch.tensor(self.resign(outputs_tensor), dtype=torch.bool)
+                self.current_boards = [board_idx for board_idx, moves in zip(self.current_boards, moving) if moves]
+                self.current_boards_tensor = self.current_boards_tensor[moving.to(self.current_boards_tensor.device)]
+                positions1d = positions1d[moving]
+
+            self.output_boards_tensor = torch.cat((self.output_boards_tensor, self.current_boards_tensor.detach().cpu()))
+            self.positions_tensor = torch.cat((self.positions_tensor, positions1d))
+
+            for idx, position1d in enumerate(positions1d.tolist()):
+                board = self.boards[self.current_boards[idx]]
+                board.set_stone(board_position(board, position1d, self.board_size))
+                if self.adjudicator is not None and self.adjudicator.virtual_connections and not board.winner and \
+                        adjudication.virtually_connected(board, 1 - board.player):
+                    self.adjudicate(self.current_boards[idx], 1 - board.player, 'virtual_connections')
+        return outputs_tensor
+
+    def resign(self, outputs_tensor):
+        '''
+        lets the players to move resign, returns for each current board whether a move is still made on it
+        '''
+        moves = []
+        for board_idx, resigns in zip(self.current_boards, self.adjudicator.resigns(outputs_tensor).tolist()):
+            board = self.boards[board_idx]
+            if resigns and len(board.made_moves) > 0:
+                # the opponent of the player to move made the last move and wins
+                self.adjudicate(board_idx, 1 - board.player, 'resignations')
+            moves.append(board.winner == False)
+        return moves
+
+    def adjudicate(self, board_idx, layer, kind):
+        board = self.boards[board_idx]
+        if not self.calibration[board_idx]:
+            adjudication.declare_winner(board, layer)
+            timer.count(kind)
+        elif board_idx not in self.calibration_triggers:
+            seat = 1 - layer if board.switch else layer
+            self.calibration_triggers[board_idx] = (kind, seat, len(board.move_history))
+
+    def count_calibration(self):
+        '''
+        counts how often the result of the calibration games differs from the adjudicated one and how many plies
+        adjudication would have saved, a virtual connection is a proven win, so overturning it means that the
+        sampled moves failed to convert it
+        '''
+        for board_idx, (kind, seat, plies) in self.calibration_triggers.items():
+            board = self.boards[board_idx]
+            timer.count(f'calibration_{kind}')
+            timer.count(f'calibration_{kind}_overturned', int(board.winner != [seat]))
+            timer.count(f'calibration_{kind}_remaining_plies', len(board.move_history) - plies)
+
+    def select_moves(self, model):
+        '''
+        evaluates the current boards and returns the outputs and the selected moves on the cpu
+        '''
         self.current_boards_tensor = self.current_boards_tensor.to(utils.device)
 
-        with torch.no_grad():
-            outputs_tensor = model(self.current_boards_tensor)
+        if self.first_outputs is not None and len(self.current_boards) == self.batch_size:
+            outputs_tensor = self.first_outputs.to(utils.device)
+        else:
+            with torch.no_grad():
+                sizes = None if self.sizes is None else self.sizes[self.current_boards].to(utils.device)
+                outputs_tensor = model(self.current_boards_tensor, sizes)
+            timer.count('forward_passes')
+            timer.count('forward_positions', len(self.current_boards))
+        self.first_outputs = None
 
-        if self.noise == 'singh':
-            noise_alpha, noise_beta, noise_lambda = self.noise_parameters
-            outputs_tensor = singh_maddala_onto_output(outputs_tensor, noise_alpha, noise_beta, noise_lambda)
-        if self.noise == 'uniform':
-            noise_probability, = self.noise_parameters
-            outputs_tensor = uniform_noise_onto_output(outputs_tensor, noise_probability)
+        boards = [self.boards[idx] for idx in self.current_boards]
+        positions1d = self.move_selector.select(outputs_tensor,
+            torch.tensor([len(board.made_moves) for board in boards]),
+            self.seeds[self.current_boards],
+            torch.tensor([len(board.move_history) for board in boards]))
+        return outputs_tensor, positions1d.detach().cpu()
 
-        moves_count = len(self.boards[self.current_boards[0]].made_moves)
-        positions1d = tempered_moves_selection(outputs_tensor, self.temperature*self.temperature_decay**moves_count)
 
-        self.output_boards_tensor = torch.cat((self.output_boards_tensor, self.current_boards_tensor.detach().cpu()))
-        self.positions_tensor = torch.cat((self.positions_tensor, positions1d.detach().cpu()))
+class MultiOpponentHexGame():
+    '''
+    plays a list of HexBoards of one model against several opponents at once
+    opponent_indices assigns an opponent to each board, model_seats whether the model plays the first (0) or second (1) move of that board
+    in each step the model evaluates all boards where it is to move in a single forward pass
+    and each opponent evaluates only its own boards where it is to move
+    temperature, temperature_decay, seeds and share_views are used as in MultiHexGame
+    '''
+    def __init__(self, boards, model, opponents, opponent_indices, model_seats, temperature, temperature_decay,
+            seeds=None, share_views=True):
+        torch.set_num_threads(4)
+        self.boards = boards
+        self.views = shared_views(boards) if share_views else None
+        self.board_size = max(board.size for board in boards)
+        self.sizes = board_sizes(boards)
+        self.model = nn.DataParallel(model).to(utils.device)
+        self.opponents = [nn.DataParallel(opponent).to(utils.device) for opponent in opponents]
+        self.opponent_indices = opponent_indices
+        self.model_seats = model_seats
+        self.move_selector = MoveSelector(None, None, temperature, temperature_decay)
+        self.seeds = default_seeds(len(boards)) if seeds is None else seeds
 
-        for idx in range(len(self.current_boards)):
-            correct_position = utils.correct_position1d(positions1d[idx].item(), self.board_size,
-                self.boards[self.current_boards[idx]].player)
-            self.boards[self.current_boards[idx]].set_stone(correct_position)
-        return outputs_tensor
+    def __repr__(self):
+        return ''.join([str(board) for board in self.boards])
+
+    def play_moves(self):
+        while self.batched_single_move():
+            pass
+        return self.boards
+
+    def batched_single_move(self):
+        '''
+        makes one move in each of the playable games, returns False if there is no game left to play
+        '''
+        movers = {}
+        for board_idx, board in enumerate(self.boards):
+            if board.winner == False:
+                # every move including the switch is recorded in move_history
+                model_to_move = len(board.move_history) % 2 == self.model_seats[board_idx]
+                mover = -1 if model_to_move else self.opponent_indices[board_idx]
+                movers.setdefault(mover, []).append(board_idx)
+
+        for mover, board_indices in movers.items():
+            model = self.model if mover == -1 else self.opponents[mover]
+            boards_tensor = gather_inputs(self.boards, board_indices, self.views).to(utils.device)
+            with torch.no_grad():
+                sizes = None if self.sizes is None else self.sizes[board_indices].to(utils.device)
+                outputs_tensor = model(boards_tensor, sizes)
+            boards = [self.boards[idx] for idx in board_indices]
+            positions1d = self.move_selector.select(outputs_tensor,
+                torch.tensor([len(board.made_moves) for board in boards]),
+                self.seeds[board_indices],
+                torch.tensor([len(board.move_history) for board in boards]))
+            for board_idx, position1d in zip(board_indices, positions1d.tolist()):
+                board = self.boards[board_idx]
+                board.set_stone(board_position(board, position1d, self.board_size))
+
+        return movers != {}
@@ -0,0 +1,99 @@
+import functools
+import weakref
+from collections import OrderedDict
+
+import torch
+
+from hexhex.logic import hexboard
+from hexhex.utils import utils
+
+
+class OpeningBook:
+    """
+    all openings of num_moves moves on a board of board_size, stored once as a tensor of move indices
+    if symmetric, only one opening per position up to move order and 180° rotation is stored,
+    weighted by the number of move sequences it stands for
+    boards after an opening are built by extending the cached board of its shorter prefix by a single stone
+    and handed out as clones, so no game has to replay its opening from an empty board
+    evaluations of the opened positions can be cached per model
+    """
+    def __init__(self, board_size, num_moves, symmetric=True, board_cache_size=4096):
+        self.board_size = board_size
+        self.num_moves = num_moves
+        if symmetric:
+            openings, weights = zip(*hexboard.canonical_first_k_moves(board_size, num_moves))
+        else:
+            openings = list(hexboard.first_k_moves(board_size, num_moves))
+            weights = [1] * len(openings)
+        self.openings = torch.tensor([[hexboard.to_move_idx(move, board_size) for move in opening]
+            for opening in openings], dtype=torch.int16)
+        self.weights = torch.tensor(weights, dtype=torch.float)
+        self.board_cache_size = board_cache_size
+        self._prefix_boards = {(): hexboard.Board(board_size)}
+        self._boards = OrderedDict()
+        self._evaluations = weakref.WeakKeyDictionary()
+
+    def __len__(self):
+        return len(self.openings)
+
+    def opening(self, idx):
+        return [hexboard.to_move(move_idx, self.board_size) for move_idx in self.openings[idx].tolist()]
+
+    def sample(self, num_openings):
+        """
+        returns the indices of num_openings openings drawn with replacement in proportion to their weight,
+        so every move sequence of the full book is equally likely and openings can repeat
+        """
+        return torch.multinomial(self.weights, num_openings, replacement=True).tolist()
+
+    def _prefix_board(self, moves):
+        # boards of all proper prefixes are kept, there are only few of them
+        if moves not in self._prefix_boards:
+            board = self._prefix_board(moves[:-1]).clone()
+            board.set_stone(moves[-1])
+            self._prefix_boards[moves] = board
+        return self._prefix_boards[moves]
+
+    def _board(self, idx):
+        if idx in self._boards:
+            self._boards.move_to_end(idx)
+            return self._boards[idx]
+        moves = tuple(self.openings[idx].tolist())
+        board = self._prefix_board(moves[:-1]).clone()
+        board.set_stone(moves[-1])
+        self._boards[idx] = board
+        if len(self._boards) > self.board_cache_size:
+            self._boards.popitem(last=False)
+        return board
+
+    def board(self, idx):
+        """
+        returns a new board after the opening with index idx
+        """
+        return self._board(idx).clone()
+
+    def boards(self, indices):
+        return [self.board(idx) for idx in indices]
+
+    def evaluate(self, model, indices):
+        """
+        returns the outputs of model for the positions after the openings with the given indices
+        outputs are computed in one batch for all indices not seen before and cached as long as model exists
+        """
+        evaluations = self._evaluations.setdefault(model, {})
+        missing = [idx for idx in dict.fromkeys(indices) if idx not in evaluations]
+        if missing != []:
+            boards_tensor = torch.stack([self._board(idx).board_tensor for idx in missing]).to(utils.device)
+            with torch.no_grad():
+                outputs_tensor = model(boards_tensor).cpu()
+            for idx, output in zip(missing, outputs_tensor):
+                evaluations[idx] = output
+        return torch.stack([evaluations[idx] for idx in indices])
+
+
+@functools.lru_cache(maxsize=None)
+def get_opening_book(board_size, num_moves, symmetric=True):
+    """
+    opening books are built once per board size and number of moves
+    """
+    return OpeningBook(board_size, num_moves, symmetric)
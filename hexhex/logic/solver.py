@@ -0,0 +1,249 @@
+"""
+exact solver for small boards and late positions
+positions are bitboards of the cell indices x * size + y, one int per player, the player to move is a layer
+like in Board: the player of layer 0 connects the first dimension, the player of layer 1 the second
+"""
+import os
+import sqlite3
+
+from hexhex.logic.hexboard import to_move
+from hexhex.logic.topology import topology
+from hexhex.utils.logger import logger
+
+
+class SearchLimitExceeded(Exception):
+    pass
+
+
+class SolverCache:
+    """
+    persistent sqlite store of solved positions, keyed by board size, both bitboards and the player to move
+    """
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS positions (
+            size INTEGER, mover TEXT, opponent TEXT, layer INTEGER, wins INTEGER,
+            PRIMARY KEY (size, mover, opponent, layer))''')
+        self.connection.commit()
+
+    def get(self, size, mover, opponent, layer):
+        row = self.connection.execute(
+            'SELECT wins FROM positions WHERE size = ? AND mover = ? AND opponent = ? AND layer = ?',
+            (size, f'{mover:x}', f'{opponent:x}', layer)).fetchone()
+        return None if row is None else bool(row[0])
+
+    def add(self, size, mover, opponent, layer, wins):
+        self.connection.execute('INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?)',
+                                (size, f'{mover:x}', f'{opponent:x}', layer, int(wins)))
+        self.connection.commit()
+
+
+class Solver:
+    """
+    depth first search for a winning move of the player to move, Hex has no draws so every position is won or lost
+    - a player with a cell that connects its edges wins at once
+    - if the opponent has two such cells the player to move loses, with one it has to take that cell
+    - positions are stored in a transposition table, root positions also in the optional SolverCache
+    max_nodes limits the positions searched per call, SearchLimitExceeded is raised beyond it
+    the transposition table is cleared once it holds more than max_table_size positions
+    """
+    def __init__(self, board_size, cache=None, max_nodes=None, max_table_size=10**6):
+        self.size = board_size
+        self.cache = cache
+        self.max_nodes = max_nodes
+        self.max_table_size = max_table_size
+        self.table = {}
+        self.nodes = 0
+        # how often each cell was a winning move, moves are tried in this order
+        self.history = [0] * board_size ** 2
+
+        geometry = topology(board_size)
+        self.full = (1 << board_size ** 2) - 1
+        first_column = sum(1 << (x * board_size) for x in range(board_size))
+        self.not_first_column = self.full & ~first_column
+        self.not_last_column = self.full & ~(first_column << (board_size - 1))
+        self.edges = geometry.edges
+        center = (board_size - 1) / 2
+        # central cells first, they are part of more connections
+        self.move_order = sorted(range(board_size ** 2), key=lambda cell: abs(cell // board_size - center) +
+                                 abs(cell % board_size - center) + abs(cell // board_size + cell % board_size - 2 * center))
+
+    @staticmethod
+    def from_config(args, board_size):
+        """
+        returns None unless solver_max_empty is set in args
+        """
+        if args.getint('solver_max_empty', fallback=0) <= 0:
+            return None
+        cache_file = args.get('solver_cache', fallback='')
+        return Solver(board_size, cache=SolverCache(cache_file) if cache_file else None,
+                      max_nodes=args.getint('solver_max_nodes', fallback=100000))
+
+    def _dilate(self, bits):
+        size = self.size
+        grown = bits | (bits >> size) | (bits << size)
+        grown |= ((bits >> 1) | (bits << (size - 1))) & self.not_last_column
+        grown |= ((bits << 1) | (bits >> (size - 1))) & self.not_first_column
+        return grown & self.full
+
+    def _reach(self, seed, region):
+        while True:
+            grown = self._dilate(seed) & region
+            if grown == seed:
+                return seed
+            seed = grown
+
+    def connected(self, stones, layer):
+        start, end = self.edges[layer]
+        return self._reach(stones & start, stones) & end != 0
+
+    def winning_cells(self, stones, empty, layer):
+        """
+        empty cells which connect the edges of layer when stones of layer are placed there
+        """
+        start, end = self.edges[layer]
+        from_start = self._dilate(self._reach(stones & start, stones)) | start
+        from_end = self._dilate(self._reach(stones & end, stones)) | end
+        return from_start & from_end & empty
+
+    def _must_play(self, mover, opponent, empty, layer):
+        """
+        the moves worth trying when the opponent has no winning cell yet
+        if the opponent can create two winning cells with a single stone, the player to move has to play that stone
+        or one of the cells, unless it creates a winning cell itself which the opponent has to block first
+        """
+        region = empty
+        for cell in range(self.size ** 2):
+            if region == 0:
+                break
+            if empty >> cell & 1:
+                threats = self.winning_cells(opponent | 1 << cell, empty & ~(1 << cell), 1 - layer)
+                if threats & (threats - 1):
+                    region &= threats | 1 << cell
+        if region == empty:
+            return empty
+        for cell in range(self.size ** 2):
+            if (empty & ~region) >> cell & 1 and self.winning_cells(mover | 1 << cell, empty & ~(1 << cell), layer):
+                region |= 1 << cell
+        return region
+
+    def _wins(self, mover, opponent, layer):
+        key = (mover, opponent, layer)
+        result = self.table.get(key)
+        if result is not None:
+            return result
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchLimitExceeded()
+
+        empty = self.full & ~(mover | opponent)
+        if self.winning_cells(mover, empty, layer):
+            result = True
+        else:
+            threats = self.winning_cells(opponent, empty, 1 - layer)
+            if threats & (threats - 1):
+                result = False
+            else:
+                candidates = threats or self._must_play(mover, opponent, empty, layer)
+                result = False
+                for cell in sorted((cell for cell in self.move_order if candidates >> cell & 1),
+                                   key=self.history.__getitem__, reverse=True):
+                    if not self._wins(opponent, mover | 1 << cell, 1 - layer):
+                        self.history[cell] += 1
+                        result = True
+                        break
+        self.table[key] = result
+        return result
+
+    def wins(self, mover, opponent, layer):
+        """
+        whether the player of layer wins with stones mover against opponent if it is to move
+        """
+        if self.cache is not None:
+            result = self.cache.get(self.size, mover, opponent, layer)
+            if result is not None:
+                return result
+        self.nodes = 0
+        if len(self.table) > self.max_table_size:
+            self.table.clear()
+        result = self._wins(mover, opponent, layer)
+        if self.cache is not None:
+            self.cache.add(self.size, mover, opponent, layer, result)
+        return result
+
+    def move_wins(self, mover, opponent, layer, cell):
+        """
+        whether placing a stone of layer on cell wins for the player of layer
+        """
+        mover |= 1 << cell
+        return self.connected(mover, layer) or not self.wins(opponent, mover, 1 - layer)
+
+    def bitboards(self, board):
+        stones = [0, 0]
+        for layer in (0, 1):
+            for group, _ in board.connected_sets[layer]:
+                for x, y in group:
+                    stones[layer] |= 1 << (x * self.size + y)
+        return stones
+
+    def _switch_available(self, board):
+        return getattr(board, 'switch_allowed', True) and not board.switch and len(board.move_history) < 2
+
+    def solve(self, board):
+        """
+        returns the seat which wins board with perfect play, in the format of board.winner
+        """
+        if board.winner:
+            return board.winner[0]
+        layer = board.player
+        seat = 1 - layer if board.switch else layer
+        # the second player wins with the switch: either it has a winning move or it takes over the first stone
+        if self._switch_available(board):
+            return 1
+        stones = self.bitboards(board)
+        return seat if self.wins(stones[layer], stones[1 - layer], layer) else 1 - seat
+
+    def winning_moves(self, board):
+        """
+        the positions which win for the player to move, including the switch if it wins
+        """
+        if board.winner:
+            return set()
+        if self._switch_available(board) and not board.made_moves:
+            return set()
+        layer = board.player
+        stones = self.bitboards(board)
+        moves = set(to_move(cell, self.size) for cell in self.move_order
+                    if to_move(cell, self.size) in board.legal_moves and not (stones[0] | stones[1]) >> cell & 1
+                    and self.move_wins(stones[layer], stones[1 - layer], layer, cell))
+        if self._switch_available(board) and not moves:
+            moves = set(board.made_moves)
+        return moves
+
+    def label(self, boards_tensor, moves_tensor, targets_tensor, max_empty):
+        """
+        exact results for the player to move of (board, move) training samples with at most max_empty empty cells
+        boards are in the view of the player to move as produced by MultiHexGame, positions where the search
+        exceeds max_nodes or the switch is still available keep their targets
+        """
+        targets = targets_tensor.clone()
+        stones = (boards_tensor[:, :, 1:-1, 1:-1] > 0.5).flatten(2).tolist()
+        num_labelled = 0
+        for idx, (mover_cells, opponent_cells) in enumerate(stones):
+            if self.size ** 2 - sum(mover_cells) - sum(opponent_cells) > max_empty:
+                continue
+            if sum(mover_cells) + sum(opponent_cells) < 2:
+                continue
+            mover = sum(1 << cell for cell, stone in enumerate(mover_cells) if stone)
+            opponent = sum(1 << cell for cell, stone in enumerate(opponent_cells) if stone)
+            try:
+                targets[idx] = float(self.move_wins(mover, opponent, 0, int(moves_tensor[idx])))
+            except SearchLimitExceeded:
+                continue
+            num_labelled += 1
+        logger.debug(f'solver labelled {num_labelled} / {len(targets)} samples')
+        return targets
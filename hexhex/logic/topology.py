@@ -0,0 +1,47 @@
+"""
+adjacency of the cells of a board, computed once per board size and shared by all boards of that size
+cells are numbered x * size + y like the outputs of the models
+"""
+from functools import lru_cache
+
+OFFSETS = ((-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0))
+
+
+class Topology:
+    """
+    neighbours: for every cell index a tuple of the indices of its neighbours
+    neighbour_positions: for every position (x, y) a frozenset of the neighbouring positions
+    edge_cells[layer][end]: the indices of the cells at the start (end=0) or end edge of the player of layer,
+    the player of layer 0 connects the first dimension, the player of layer 1 the second
+    edges holds the same as bitmasks of cell indices
+    """
+    def __init__(self, size):
+        self.size = size
+        self.num_cells = size * size
+        self.positions = tuple((x, y) for x in range(size) for y in range(size))
+
+        neighbour_positions = []
+        for x, y in self.positions:
+            neighbour_positions.append(tuple((x + dx, y + dy) for dx, dy in OFFSETS
+                                             if 0 <= x + dx < size and 0 <= y + dy < size))
+        self.neighbours = tuple(tuple(nx * size + ny for nx, ny in cell_neighbours)
+                                for cell_neighbours in neighbour_positions)
+        self.neighbour_positions = {position: frozenset(cell_neighbours)
+                                    for position, cell_neighbours in zip(self.positions, neighbour_positions)}
+        self.edge_cells = tuple(tuple(tuple(x * size + y for x, y in self.positions
+                                            if (x, y)[layer] == (size - 1 if end else 0))
+                                      for end in (0, 1))
+                                for layer in (0, 1))
+        self.edges = tuple(tuple(sum(1 << cell for cell in cells) for cells in layer_cells)
+                           for layer_cells in self.edge_cells)
+
+    def index(self, position):
+        return position[0] * self.size + position[1]
+
+    def on_edge(self, cell, layer, end):
+        return bool(self.edges[layer][end] >> cell & 1)
+
+
+@lru_cache(maxsize=None)
+def topology(size):
+    return Topology(size)
@@ -0,0 +1,183 @@
+"""
+checkpoint file layout, the extension stays .pt:
+    8 bytes  MAGIC
+    8 bytes  little endian length of the header
+    header   utf-8 JSON {"config": {...}, "metadata": {...}, "tensors": {name: {dtype, shape, offset, nbytes}}}
+    padding  up to a multiple of ALIGNMENT
+    data     the raw tensors, offsets are relative to the start of data and aligned to ALIGNMENT
+the header can be read without touching the weights and the weights are memory mapped
+files written by torch.save before this format are still read by load_checkpoint
+"""
+import json
+import os
+import struct
+import time
+from configparser import ConfigParser
+
+import numpy as np
+import torch
+
+MAGIC = b'HEXHEX\x00\x01'
+ALIGNMENT = 64
+INDEX_FILE = 'index.json'
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def config_dict(config):
+    return {key: str(value) for key, value in config.items()}
+
+
+def config_section(config):
+    """
+    the dict of a checkpoint header as section, as expected by create_model
+    """
+    parser = ConfigParser()
+    parser.read_dict({'CREATE MODEL': config})
+    return parser['CREATE MODEL']
+
+
+def is_checkpoint(model_file):
+    with open(model_file, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def save_checkpoint(model_file, state_dict, config, metadata=None):
+    """
+    writes to a temporary file first, so readers never see a partially written checkpoint
+    """
+    tensors = {}
+    offset = 0
+    arrays = []
+    for name, tensor in state_dict.items():
+        array = tensor.detach().cpu().contiguous().numpy()
+        offset = _aligned(offset)
+        tensors[name] = {'dtype': array.dtype.name, 'shape': list(array.shape), 'offset': offset,
+                         'nbytes': array.nbytes}
+        arrays.append((offset, array))
+        offset += array.nbytes
+    metadata = dict(metadata or {})
+    metadata.setdefault('created', time.time())
+    metadata['num_parameters'] = sum(int(np.prod(info['shape'])) for info in tensors.values())
+    header = json.dumps({'config': config_dict(config), 'metadata': metadata, 'tensors': tensors}).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    temporary_file = f'{model_file}.tmp'
+    with open(temporary_file, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header)))
+        file.write(header)
+        for offset, array in arrays:
+            file.seek(data_start + offset)
+            file.write(array.tobytes())
+    os.replace(temporary_file, model_file)
+
+
+def _read_header(file):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'{file.name} is not a checkpoint, convert it with python -m hexhex.model.migrate')
+    header_length, = struct.unpack('<Q', file.read(8))
+    header = json.loads(file.read(header_length))
+    header['data_start'] = _aligned(len(MAGIC) + 8 + header_length)
+    return header
+
+
+def read_header(model_file):
+    """
+    returns config, metadata and tensor layout without reading any weights
+    """
+    with open(model_file, 'rb') as file:
+        return _read_header(file)
+
+
+def read_state_dict(model_file, names=None):
+    """
+    returns the tensors with the given names, all by default, as copy-on-write memory maps of the file
+    """
+    header = read_header(model_file)
+    data = np.memmap(model_file, mode='c')
+    state_dict = {}
+    for name, info in header['tensors'].items():
+        if names is not None and name not in names:
+            continue
+        start = header['data_start'] + info['offset']
+        array = data[start:start + info['nbytes']].view(np.dtype(info['dtype'])).reshape(info['shape'])
+        state_dict[name] = torch.from_numpy(array)
+    return state_dict
+
+
+def load_checkpoint(model_file):
+    """
+    returns the model config as section, the state dict and the metadata
+    """
+    if is_checkpoint(model_file):
+        header = read_header(model_file)
+        return config_section(header['config']), read_state_dict(model_file), header['metadata']
+    checkpoint = torch.load(model_file, map_location='cpu', weights_only=False)
+    return checkpoint['config'], checkpoint['model_state_dict'], {}
+
+
+def model_name(model_file):
+    return os.path.splitext(os.path.basename(model_file))[0]
+
+
+def save_model(model_dir, name, state_dict, config, metadata=None):
+    """
+    writes models/{name}.pt and adds it to the index of model_dir
+    """
+    model_file = os.path.join(model_dir, f'{name}.pt')
+    save_checkpoint(model_file, state_dict, config, metadata)
+    update_index(model_dir, [name])
+    return model_file
+
+
+def _index_entry(model_file):
+    header = read_header(model_file)
+    return {
+        'mtime': os.path.getmtime(model_file),
+        'config': header['config'],
+        'metadata': header['metadata'],
+    }
+
+
+def read_index(model_dir='models'):
+    index_file = os.path.join(model_dir, INDEX_FILE)
+    if not os.path.isfile(index_file):
+        return {}
+    with open(index_file) as file:
+        return json.load(file)
+
+
+def write_index(model_dir, index):
+    index_file = os.path.join(model_dir, INDEX_FILE)
+    with open(f'{index_file}.tmp', 'w') as file:
+        json.dump(index, file, indent=1, sort_keys=True)
+    os.replace(f'{index_file}.tmp', index_file)
+
+
+def update_index(model_dir='models', names=None):
+    """
+    refreshes the entries of the given model names, or of all checkpoints in model_dir whose file changed
+    files in the old torch.save format are skipped, run hexhex.model.migrate for them
+    """
+    index = read_index(model_dir)
+    changed = False
+    if names is None:
+        names = set(model_name(file_name) for file_name in os.listdir(model_dir) if file_name.endswith('.pt'))
+        for name in [name for name in index if name not in names]:
+            del index[name]
+            changed = True
+    for name in names:
+        model_file = os.path.join(model_dir, f'{name}.pt')
+        if not os.path.isfile(model_file):
+            changed |= index.pop(name, None) is not None
+        elif name not in index or index[name]['mtime'] != os.path.getmtime(model_file):
+            if is_checkpoint(model_file):
+                index[name] = _index_entry(model_file)
+                changed = True
+    if changed:
+        write_index(model_dir, index)
+    return index
+
@@ -2,28 +2,34 @@ import sys
 
 import torch
 
-from hexhex.utils.utils import device
+from hexhex.model import checkpoint
 
 
 def convert_boardsize_of_model(model_name, new_bs):
-    checkpoint = torch.load(f'models/{model_name}.pt', map_location=device)
-    config = checkpoint['config']
+    config, state_dict, metadata = checkpoint.load_checkpoint(f'models/{model_name}.pt')
+    old_bs = config['board_size']
     config['board_size'] = new_bs
 
     bias_key = 'bias'
     while True:
-        if bias_key in checkpoint['model_state_dict']:
-            checkpoint['model_state_dict'][bias_key] = torch.zeros(int(new_bs)**2)
+        if bias_key in state_dict:
+            # the bias of the old size is kept as size bias, models trained with a curriculum
+            # may already have a bias for the new size
+            size_bias_prefix = bias_key[:-len('bias')] + 'size_biases.'
+            old_bias = state_dict[bias_key]
+            state_dict[bias_key] = state_dict.pop(size_bias_prefix + str(new_bs), torch.zeros(int(new_bs)**2))
+            state_dict[size_bias_prefix + str(old_bs)] = old_bias
             break
         bias_key = 'internal_model.' + bias_key
 
-    torch.save({
-    'model_state_dict': checkpoint['model_state_dict'],
-    'config': config,
-    'optimizer': False
-    }, f'models/{new_bs}_{model_name}.pt')
+    size_biases = sorted(int(key[len(size_bias_prefix):]) for key in state_dict if key.startswith(size_bias_prefix))
+    config['size_biases'] = ','.join(str(size) for size in size_biases)
+
+    metadata['parent'] = model_name
+    file_name = checkpoint.save_model('models', f'{new_bs}_{model_name}', state_dict, config, metadata)
     print('=== converted model size ===')
-    print(f'wrote models/{new_bs}_{model_name}.pt')
+    print(f'wrote {file_name}')
+
 
 if __name__ == '__main__':
     old_model_name = sys.argv[1]
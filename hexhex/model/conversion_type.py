@@ -1,28 +1,21 @@
 import sys
 
-import torch
-
-from hexhex.utils.utils import device
+from hexhex.model import checkpoint
 
 
 def convert_model(model_name):
-    checkpoint = torch.load(f'models/{model_name}.pt', map_location=device)
-    config = checkpoint['config']
+    config, state_dict, metadata = checkpoint.load_checkpoint(f'models/{model_name}.pt')
     if config['model_type'] in ['inception', 'conv']:
         config['model_type'] = 'conv'
 
         weight_key = 'conv.weight'
         while True:
-            if weight_key in checkpoint['model_state_dict']:
-                config['reach'] = str(checkpoint['model_state_dict'][weight_key].shape[2] // 2)
+            if weight_key in state_dict:
+                config['reach'] = str(state_dict[weight_key].shape[2] // 2)
                 break
             weight_key = 'internal_model.' + weight_key
 
-        torch.save({
-        'model_state_dict': checkpoint['model_state_dict'],
-        'config': config,
-        'optimizer': False
-        }, f'models/{model_name}.pt')
+        checkpoint.save_model('models', model_name, state_dict, config, metadata)
         print('=== converted model type ===')
     else:
         print('=== model type is not "inception" or "conv" ===')
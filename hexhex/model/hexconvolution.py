@@ -1,5 +1,9 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
+from hexhex.logic import distance
+from hexhex.model import padding
 
 
 def swish(x):
@@ -23,21 +27,56 @@ class Conv(nn.Module):
     model consists of a convolutional layer to change the number of channels from two input channels to intermediate channels
     then a specified amount of residual or skip-layers https://en.wikipedia.org/wiki/Residual_neural_network
     then policyconv reduce the intermediate channels to one
+    with distance_planes the two-distance potentials of both players are added as two more input channels
     value range is (-inf, inf) 
     for training the sigmoid is taken, interpretable as probability to win the game when making this move
     for data generation and evaluation the softmax is taken to select a move
+    boards of other sizes and batches of padded boards of several sizes are evaluated as well,
+    the activations are masked to each board after every layer, which is the zero padding a board of its own size gets
+    for batches of several sizes the caller passes the size of each board, see padding.board_sizes,
+    so the model never has to read the sizes back from the device
+    size_biases adds a bias like bias for each of the given smaller sizes, all sizes share the convolutions
     '''
-    def __init__(self, board_size, layers, intermediate_channels, reach, export_mode):
+    def __init__(self, board_size, layers, intermediate_channels, reach, export_mode, distance_planes=False,
+                 size_biases=()):
         super(Conv, self).__init__()
         self.board_size = board_size
-        self.conv = nn.Conv2d(2, intermediate_channels, kernel_size=2*reach+1, padding=reach-1)
+        self.distance_planes = distance_planes
+        self.conv = nn.Conv2d(4 if distance_planes else 2, intermediate_channels, kernel_size=2*reach+1, padding=reach-1)
         self.skiplayers = nn.ModuleList([SkipLayerBias(intermediate_channels, 1) for idx in range(layers)])
         self.policyconv = nn.Conv2d(intermediate_channels, 1, kernel_size=2*reach+1, padding=reach, bias=False)
         self.bias = nn.Parameter(torch.zeros(board_size**2))
+        self.size_biases = nn.ParameterDict({str(size): nn.Parameter(torch.zeros(size**2))
+                                             for size in size_biases if size != board_size})
         self.export_mode = export_mode
 
-    def forward(self, x):
+    def size_bias(self, size):
+        '''
+        the bias of the cells of a board of the given size, zero for sizes without a bias
+        '''
+        if size == self.board_size:
+            return self.bias.view(size, size)
+        if str(size) in self.size_biases:
+            return self.size_biases[str(size)].view(size, size)
+        return torch.zeros(size, size, device=self.bias.device)
+
+    def padded_bias(self, sizes, size):
+        bias = torch.zeros(len(sizes), size, size, device=self.bias.device)
+        for board_size in [self.board_size] + [int(key) for key in self.size_biases]:
+            if board_size <= size:
+                selected = (sizes == board_size).to(bias.dtype).view(-1, 1, 1)
+                bias = bias + selected * F.pad(self.size_bias(board_size), (0, size - board_size, 0, size - board_size))
+        return bias.view(-1, size**2)
+
+    def forward(self, x, sizes=None):
+        size = x.shape[-1] - 2
+        if sizes is not None or (size != self.board_size and not self.export_mode):
+            if sizes is None:
+                sizes = torch.full((len(x),), size, dtype=torch.long, device=x.device)
+            return self.padded_forward(x, sizes, size)
         x_sum = torch.sum(x[:, :, 1:-1, 1:-1], dim=1).view(-1,self.board_size**2)
+        if self.distance_planes:
+            x = torch.cat([x, distance.distance_planes(x)], dim=1)
         x = self.conv(x)
         for skiplayer in self.skiplayers:
             x = skiplayer(x)
@@ -47,6 +86,16 @@ class Conv(nn.Module):
         illegal = x_sum * torch.exp(torch.tanh((x_sum.sum(dim=1)-1)*1000)*10).unsqueeze(1).expand_as(x_sum) - x_sum
         return self.policyconv(x).view(-1, self.board_size**2) + self.bias - illegal
 
+    def padded_forward(self, x, sizes, size):
+        illegal = padding.illegal_moves(x) + padding.outside_moves(sizes, size)
+        mask = padding.cell_mask(sizes, size).unsqueeze(1).to(x.dtype)
+        if self.distance_planes:
+            x = torch.cat([x, distance.distance_planes(x)], dim=1)
+        x = self.conv(x) * mask
+        for skiplayer in self.skiplayers:
+            x = skiplayer(x) * mask
+        return self.policyconv(x).view(-1, size**2) + self.padded_bias(sizes, size) - illegal
+
 
 class RandomModel(nn.Module):
     '''
@@ -57,9 +106,9 @@ class RandomModel(nn.Module):
         super(RandomModel, self).__init__()
         self.board_size = board_size
 
-    def forward(self, x):
-        x_sum = torch.sum(x[:, :, 1:-1, 1:-1], dim=1).view(-1,self.board_size**2)
-        illegal = x_sum * torch.exp(torch.tanh((x_sum.sum(dim=1)-1)*1000)*10).unsqueeze(1).expand_as(x_sum) - x_sum
+    def forward(self, x, sizes=None):
+        sizes = padding.board_sizes(x) if sizes is None else sizes
+        illegal = padding.illegal_moves(x) + padding.outside_moves(sizes, x.shape[-1] - 2)
         return torch.rand_like(illegal) - illegal
 
 
@@ -72,9 +121,9 @@ class NoSwitchWrapperModel(nn.Module):
         self.board_size = model.board_size
         self.internal_model = model
 
-    def forward(self, x):
-        illegal = 1000*torch.sum(x[:, :, 1:-1, 1:-1], dim=1).view(-1,self.board_size**2)
-        return self.internal_model(x)-illegal
+    def forward(self, x, sizes=None):
+        illegal = 1000*torch.sum(x[:, :2, 1:-1, 1:-1], dim=1).flatten(1)
+        return self.internal_model(x, sizes)-illegal
 
 
 class RotationWrapperModel(nn.Module):
@@ -88,9 +137,13 @@ class RotationWrapperModel(nn.Module):
         self.internal_model = model
         self.export_mode = export_mode
 
-    def forward(self, x):
+    def forward(self, x, sizes=None):
         if self.export_mode:
             return self.internal_model(x)
+        if sizes is not None:
+            size = x.shape[-1] - 2
+            y = padding.rotate_outputs(self.internal_model(padding.rotate_boards(x, sizes), sizes), sizes, size)
+            return (self.internal_model(x, sizes) + y)/2
         x_flip = torch.flip(x, [2, 3])
         y_flip = self.internal_model(x_flip)
         y = torch.flip(y_flip, [1])
@@ -1,3 +1,5 @@
+import time
+
 import numpy as np
 import torch
 
@@ -66,6 +68,30 @@ class Simulation:
 
         return [q.num_samples for q in self.root.Q]
 
+    def run_for(self, seconds, max_simulations=None, check_interval=16):
+        """
+        runs simulations until seconds have passed, max_simulations are done or the most visited move
+        cannot change anymore because its lead is larger than the number of simulations still to come
+        returns the visit counts and the number of simulations
+        """
+        start = time.perf_counter()
+        simulations = 0
+        while max_simulations is None or simulations < max_simulations:
+            self.run_simulation()
+            simulations += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                break
+            if simulations % check_interval == 0:
+                remaining = simulations / elapsed * (seconds - elapsed)
+                if max_simulations is not None:
+                    remaining = min(remaining, max_simulations - simulations)
+                second, first = sorted(q.num_samples for q in self.root.Q)[-2:]
+                if first - second > remaining:
+                    break
+
+        return [q.num_samples for q in self.root.Q], simulations
+
     def run_simulation(self):
         self.root.visit()
 
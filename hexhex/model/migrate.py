@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+converts model files written with torch.save into the checkpoint format and builds models/index.json
+python -m hexhex.model.migrate [model_dir] [--keep]
+the modification time is kept, so matches stored in the MatchDatabase stay valid
+with --keep the original file is kept as {name}.pt.bak
+"""
+import os
+import shutil
+import sys
+
+from hexhex.model import checkpoint
+from hexhex.utils.logger import logger
+
+
+def migrate_model(model_file, keep=False):
+    """
+    returns False if model_file already is in the checkpoint format
+    """
+    if checkpoint.is_checkpoint(model_file):
+        return False
+    config, state_dict, metadata = checkpoint.load_checkpoint(model_file)
+    stat = os.stat(model_file)
+    if keep:
+        shutil.copy2(model_file, f'{model_file}.bak')
+    metadata['created'] = stat.st_mtime
+    checkpoint.save_checkpoint(model_file, state_dict, config, metadata)
+    os.utime(model_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return True
+
+
+def migrate(model_dir='models', keep=False):
+    migrated = 0
+    for root, _, file_names in os.walk(model_dir):
+        for file_name in sorted(file_names):
+            if file_name.endswith('.pt'):
+                model_file = os.path.join(root, file_name)
+                if migrate_model(model_file, keep):
+                    logger.info(f'migrated {model_file}')
+                    migrated += 1
+    index = checkpoint.update_index(model_dir)
+    logger.info(f'migrated {migrated} models, {len(index)} models in {os.path.join(model_dir, checkpoint.INDEX_FILE)}')
+
+
+if __name__ == '__main__':
+    arguments = [argument for argument in sys.argv[1:] if argument != '--keep']
+    migrate(*arguments[:1], keep='--keep' in sys.argv)
@@ -0,0 +1,88 @@
+"""
+boards of different sizes in one batch: each board tensor of size s, border included, is placed in the top left
+corner of a zero tensor of the largest size, cells outside of a board are masked by the models
+"""
+import torch
+import torch.nn.functional as F
+
+# added to the outputs of cells outside of a board, MoveSelector treats outputs below -900 as illegal
+OUTSIDE_PENALTY = 10000.
+
+
+def board_sizes(x):
+    '''
+    sizes of the boards in a batch of padded board tensors, row 0 of channel 0 is the border of the player to move
+    and holds a 1 for every column of the board in both views
+    '''
+    return x[:, 0, 0, :].sum(1).round().long()
+
+
+def pad_board_tensor(board_tensor, size):
+    '''
+    pads a board tensor of shape (channels, s+2, s+2) to (channels, size+2, size+2)
+    '''
+    padding = size + 2 - board_tensor.shape[-1]
+    return F.pad(board_tensor, (0, padding, 0, padding))
+
+
+def pad_samples(board_states, moves, size):
+    '''
+    pads a batch of board tensors to size and maps their moves of shape (batch, 1) to the cells of size
+    '''
+    padded_size = board_states.shape[-1] - 2
+    if padded_size == size:
+        return board_states, moves
+    return pad_board_tensor(board_states, size), moves // padded_size * size + moves % padded_size
+
+
+def cell_mask(sizes, size):
+    '''
+    boolean tensor of shape (len(sizes), size, size), True for the cells of each board
+    '''
+    inside = torch.arange(size, device=sizes.device).unsqueeze(0) < sizes.unsqueeze(1)
+    return inside.unsqueeze(2) & inside.unsqueeze(1)
+
+
+def illegal_moves(x):
+    '''
+    penalty of shape (batch, size**2) for occupied cells, the cell of the first stone is legal as long as
+    switching is possible, the far borders of smaller boards are not counted as stones
+    '''
+    size = x.shape[-1] - 2
+    x_sum = torch.sum(x[:, :2, 1:-1, 1:-1], dim=1) * cell_mask(board_sizes(x), size)
+    x_sum = x_sum.view(-1, size**2)
+    return x_sum * torch.exp(torch.tanh((x_sum.sum(dim=1)-1)*1000)*10).unsqueeze(1).expand_as(x_sum) - x_sum
+
+
+def outside_moves(sizes, size):
+    '''
+    penalty of shape (len(sizes), size**2) for the cells outside of each board
+    '''
+    return OUTSIDE_PENALTY * (~cell_mask(sizes, size)).flatten(1).float()
+
+
+def _rotation_indices(sizes, length, offset):
+    indices = torch.arange(length, device=sizes.device).unsqueeze(0)
+    limits = sizes.unsqueeze(1) + offset
+    return torch.where(indices < limits, limits - 1 - indices, indices)
+
+
+def rotate_boards(x, sizes):
+    '''
+    180° rotation of each board tensor within its own size, padding stays in place
+    '''
+    batch, channels, length, _ = x.shape
+    rotation = _rotation_indices(sizes, length, 2)
+    x = torch.gather(x, 2, rotation[:, None, :, None].expand(batch, channels, length, length))
+    return torch.gather(x, 3, rotation[:, None, None, :].expand(batch, channels, length, length))
+
+
+def rotate_outputs(y, sizes, size):
+    '''
+    180° rotation of outputs of shape (batch, size**2) within the size of each board
+    '''
+    batch = y.shape[0]
+    rotation = _rotation_indices(sizes, size, 0)
+    y = y.view(batch, size, size)
+    y = torch.gather(y, 1, rotation[:, :, None].expand(batch, size, size))
+    return torch.gather(y, 2, rotation[:, None, :].expand(batch, size, size)).reshape(batch, size**2)
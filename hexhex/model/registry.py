@@ -0,0 +1,52 @@
+import os
+import threading
+from collections import OrderedDict
+
+from hexhex.utils.utils import load_model
+
+
+class ModelRegistry:
+    """
+    least recently used cache of loaded models keyed by path and modification time
+    a model file that is overwritten, e.g. by training, is loaded again on the next request
+    with share_memory the weights are copied out of the memory map into shared memory, workers which receive such a model
+    as argument or inherit it by forking use the same copy instead of loading their own
+    cached models are shared by all callers, use utils.load_model for a model that will be trained
+    """
+    def __init__(self, max_models=16, share_memory=False):
+        self.max_models = max_models
+        self.share_memory = share_memory
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, model_file, share_memory=None):
+        key = (os.path.abspath(model_file), os.stat(model_file).st_mtime_ns)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key]
+        model = load_model(model_file)
+        if self.share_memory if share_memory is None else share_memory:
+            model.share_memory()
+        with self.lock:
+            # drop outdated versions of the same file
+            for old_key in [old_key for old_key in self.models if old_key[0] == key[0]]:
+                del self.models[old_key]
+            self.models[key] = model
+            while len(self.models) > self.max_models:
+                self.models.popitem(last=False)
+        return model
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_name, share_memory=None):
+    """
+    returns the cached model models/{model_name}.pt
+    """
+    return registry.get(f'models/{model_name}.pt', share_memory)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+sends concurrent requests with random positions to a running move server and reports throughput and latency
+python -m hexhex.serving.load_generator [url] [concurrency] [num_requests] [endpoint] [board_size]
+"""
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+
+from hexhex.logic import hexboard
+from hexhex.serving.server import percentiles
+
+
+def random_moves(board_size, rng):
+    positions = hexboard.all_moves(board_size)
+    rng.shuffle(positions)
+    moves = []
+    for position in positions[:rng.randrange(board_size ** 2 // 2)]:
+        alpha, numeric = hexboard.position_to_alpha_numeric(position)
+        moves.append(f'{alpha}{numeric}')
+    return moves
+
+
+async def client(session, url, requests, latencies, rng, board_size):
+    for request in requests:
+        start = time.perf_counter()
+        async with session.post(url, json={'moves': random_moves(board_size, rng), **request}) as response:
+            await response.json()
+        latencies.append(time.perf_counter() - start)
+
+
+async def generate_load(url, concurrency, num_requests, endpoint, board_size, request=None, seed=0):
+    rng = random.Random(seed)
+    latencies = []
+    requests_per_client = [[request or {}] * (num_requests // concurrency + (idx < num_requests % concurrency))
+                           for idx in range(concurrency)]
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[client(session, f'{url}/{endpoint}', requests, latencies, rng, board_size)
+                               for requests in requests_per_client])
+        duration = time.perf_counter() - start
+        async with session.get(f'{url}/stats') as response:
+            server_stats = await response.json()
+    return {
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / duration,
+        **percentiles(latencies),
+        'server_mean_batch_size': server_stats.get('mean_batch_size'),
+    }
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else 'http://localhost:8080'
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    num_requests = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    endpoint = sys.argv[4] if len(sys.argv) > 4 else 'move'
+    board_size = int(sys.argv[5]) if len(sys.argv) > 5 else 11
+    report = asyncio.run(generate_load(url, concurrency, num_requests, endpoint, board_size))
+    for key, value in report.items():
+        print(f'{key:25} {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+import asyncio
+import collections
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+
+import numpy as np
+import torch
+from aiohttp import web, WSMsgType
+
+from hexhex.logic import hexboard
+from hexhex.model import mcts
+from hexhex.utils import utils
+from hexhex.utils.logger import logger
+from hexhex.utils.utils import load_model
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    if len(values) == 0:
+        return {f'p{p}': None for p in ps}
+    return {f'p{p}': float(np.percentile(values, p)) for p in ps}
+
+
+class BatchedModel:
+    '''
+    collects the evaluations requested by concurrent requests and runs them as single forward passes
+    a batch is run as soon as max_batch_size positions are waiting or the oldest has waited max_wait seconds
+    calling the instance from another thread evaluates through the batches as well, this is used by MCTS
+    '''
+    def __init__(self, model, max_batch_size, max_wait):
+        self.model = model
+        self.board_size = model.board_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        # a single thread runs all forward passes, so the event loop stays responsive
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.loop = asyncio.get_running_loop()
+        self.batch_sizes = collections.deque(maxlen=10000)
+
+    async def evaluate(self, boards_tensor):
+        futures = []
+        for board_tensor in boards_tensor:
+            future = self.loop.create_future()
+            await self.queue.put((board_tensor, future))
+            futures.append(future)
+        return torch.stack(await asyncio.gather(*futures))
+
+    def __call__(self, boards_tensor):
+        return asyncio.run_coroutine_threadsafe(self.evaluate(boards_tensor.cpu()), self.loop).result()
+
+    def _forward(self, boards_tensor):
+        with torch.no_grad():
+            return self.model(boards_tensor.to(utils.device)).cpu()
+
+    async def run(self):
+        while True:
+            items = [await self.queue.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(items) < self.max_batch_size:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            boards_tensor = torch.stack([board_tensor for board_tensor, _ in items])
+            outputs_tensor = await self.loop.run_in_executor(self.executor, self._forward, boards_tensor)
+            self.batch_sizes.append(len(items))
+            for (_, future), output in zip(items, outputs_tensor):
+                if not future.cancelled():
+                    future.set_result(output)
+
+
+class MoveServer:
+    '''
+    serves move suggestions and position ratings of a model over HTTP and WebSocket
+    POST /move and /rate and messages on /ws take a JSON object with the moves played so far in
+    alpha numeric notation, e.g. {"moves": ["f6", "c3"]}, and optional MCTS budgets
+    "mcts_simulations" and "mcts_time" in seconds for /move, limited to max_mcts_simulations and max_mcts_time
+    GET /stats returns latency percentiles in seconds and the mean forward pass batch size
+    '''
+    def __init__(self, config):
+        self.config = config
+        self.model = load_model(f'models/{config.get("model", "11_2w4_2000")}.pt')
+        self.switch = config.getboolean('switch', True)
+        self.max_batch_size = config.getint('max_batch_size', 64)
+        self.max_wait = config.getfloat('max_wait_ms', 2.) / 1000
+        self.mcts_executor = ThreadPoolExecutor(max_workers=config.getint('mcts_threads', 16))
+        self.max_mcts_simulations = config.getint('max_mcts_simulations', 1600)
+        self.max_mcts_time = config.getfloat('max_mcts_time', 10.)
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=10000))
+        self.batched_model = None
+
+    @staticmethod
+    def check_request(request):
+        if not isinstance(request, dict):
+            raise ValueError('the request has to be a JSON object')
+        return request
+
+    @staticmethod
+    def budget(request, key, maximum):
+        value = request.get(key, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'{key} has to be a number')
+        return min(value, maximum)
+
+    def create_board(self, request):
+        board = hexboard.Board(self.model.board_size, self.switch)
+        for move in request.get('moves', []):
+            position = hexboard.alpha_numeric_to_position(move)
+            if position not in board.legal_moves:
+                raise ValueError(f'illegal move {move}')
+            board.set_stone(position)
+        return board
+
+    async def rate(self, request):
+        board = self.create_board(request)
+        output = (await self.batched_model.evaluate(board.board_tensor.unsqueeze(0)))[0]
+        # ratings are returned in board coordinates, not in the view of the player to move
+        ratings = [0.] * self.model.board_size ** 2
+        for move1d, rating in enumerate(output.tolist()):
+            ratings[utils.correct_position1d(move1d, board.size, board.player)] = rating
+        return {'ratings': ratings}
+
+    def search(self, board, simulations, seconds):
+        simulation = mcts.Simulation(self.batched_model, self.config, board)
+        move_counts, _ = simulation.run_for(seconds, max_simulations=simulations)
+        return int(np.argmax(move_counts))
+
+    async def move(self, request):
+        board = self.create_board(request)
+        if board.winner:
+            raise ValueError('game is over')
+        simulations = int(self.budget(request, 'mcts_simulations', self.max_mcts_simulations))
+        seconds = self.budget(request, 'mcts_time', self.max_mcts_time)
+        if simulations > 0 or seconds > 0:
+            move1d = await asyncio.get_running_loop().run_in_executor(self.mcts_executor, self.search, board,
+                simulations if simulations > 0 else None, seconds if seconds > 0 else self.max_mcts_time)
+        else:
+            output = (await self.batched_model.evaluate(board.board_tensor.unsqueeze(0)))[0]
+            move1d = output.argmax().item()
+        position = hexboard.to_move(utils.correct_position1d(move1d, board.size, board.player), board.size)
+        alpha, numeric = hexboard.position_to_alpha_numeric(position)
+        return {'move': f'{alpha}{numeric}'}
+
+    async def timed(self, name, handler, request):
+        start = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            self.latencies[name].append(time.perf_counter() - start)
+
+    async def handle_http(self, http_request, name, handler):
+        try:
+            request = self.check_request(await http_request.json())
+            return web.json_response(await self.timed(name, handler, request))
+        except (ValueError, KeyError, IndexError) as error:
+            return web.json_response({'error': str(error)}, status=400)
+
+    async def handle_move(self, http_request):
+        return await self.handle_http(http_request, 'move', self.move)
+
+    async def handle_rate(self, http_request):
+        return await self.handle_http(http_request, 'rate', self.rate)
+
+    async def handle_stats(self, http_request):
+        stats = {name: dict(count=len(values), **percentiles(values)) for name, values in self.latencies.items()}
+        batch_sizes = self.batched_model.batch_sizes
+        stats['mean_batch_size'] = float(np.mean(batch_sizes)) if len(batch_sizes) > 0 else None
+        return web.json_response(stats)
+
+    async def handle_websocket(self, http_request):
+        '''
+        every message is answered with the same "id", "type" is either "move" or "rate"
+        '''
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(http_request)
+
+        async def respond(data):
+            request = {}
+            try:
+                request = self.check_request(json.loads(data))
+                handler = self.move if request.get('type', 'move') == 'move' else self.rate
+                response = await self.timed(f'ws_{request.get("type", "move")}', handler, request)
+            except (ValueError, KeyError, IndexError) as error:
+                response = {'error': str(error)}
+            response['id'] = request.get('id')
+            await websocket.send_str(json.dumps(response))
+
+        tasks = []
+        async for message in websocket:
+            if message.type == WSMsgType.TEXT:
+                tasks.append(asyncio.ensure_future(respond(message.data)))
+        await asyncio.gather(*tasks)
+        return websocket
+
+    async def start_batching(self, app):
+        self.batched_model = BatchedModel(self.model, self.max_batch_size, self.max_wait)
+        app['batching'] = asyncio.ensure_future(self.batched_model.run())
+
+    async def stop_batching(self, app):
+        app['batching'].cancel()
+
+    def create_app(self):
+        app = web.Application()
+        app.add_routes([
+            web.post('/move', self.handle_move),
+            web.post('/rate', self.handle_rate),
+            web.get('/stats', self.handle_stats),
+            web.get('/ws', self.handle_websocket),
+        ])
+        app.on_startup.append(self.start_batching)
+        app.on_cleanup.append(self.stop_batching)
+        return app
+
+
+def main():
+    config = ConfigParser()
+    config.read('config.ini')
+    if not config.has_section('SERVE'):
+        config.add_section('SERVE')
+    server = MoveServer(config['SERVE'])
+    host = config.get('SERVE', 'host', fallback='localhost')
+    port = config.getint('SERVE', 'port', fallback=8080)
+    logger.info(f'serving {config.get("SERVE", "model", fallback="11_2w4_2000")} on http://{host}:{port}')
+    web.run_app(server.create_app(), host=host, port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,22 @@
 #!/usr/bin/env python3
 import json
 import os
-from collections import defaultdict
 from configparser import ConfigParser
 
 import torch
 
 from hexhex.creation import create_data, create_model
-from hexhex.elo import elo
+from hexhex.elo import elo, tournament
+from hexhex.elo.match import MatchDatabase
 from hexhex.evaluation import win_position
+from hexhex.evaluation.sprt import SPRT
+from hexhex.model import registry
 from hexhex.model.hexconvolution import RandomModel
 from hexhex.training import train
 from hexhex.utils.logger import logger
+from hexhex.utils.profiling import capture, timer
 from hexhex.utils.summary import writer
-from hexhex.utils.utils import load_model, merge_dicts_of_dicts
+from hexhex.utils.utils import merge_dicts_of_dicts
 
 
 def load_reference_models(config):
@@ -31,6 +34,22 @@ def load_reference_models(config):
     return reference_models[board_size_str]
 
 
+def parse_curriculum(curriculum, board_size):
+    """
+    parses 'size:iteration,...' into a sorted list of (iteration, size), every size is self-played from its
+    iteration on, e.g. 5:1,7:10,11:30 starts on 5x5 boards and adds 7x7 at iteration 10 and 11x11 at 30
+    """
+    stages = []
+    for stage in curriculum.split(','):
+        if not stage.strip():
+            continue
+        size, iteration = (int(value) for value in stage.split(':'))
+        if size > board_size:
+            raise ValueError(f'curriculum size {size} is larger than the board_size {board_size} of the model')
+        stages.append((iteration, size))
+    return sorted(stages)
+
+
 class RepeatedSelfTrainer:
     def __init__(self, config):
         self.config = config
@@ -40,8 +59,17 @@ class RepeatedSelfTrainer:
         self.model_name = self.config.get('CREATE MODEL', 'model_name')
         self.model_names = []
         self.start_index = self.config.getint('REPEATED SELF TRAINING', 'start_index', fallback=0)
-        self.tournament_results = defaultdict(lambda: defaultdict(int))
+        self.match_database = MatchDatabase(self.config.get('REPEATED SELF TRAINING', 'match_database',
+            fallback='data/matches.db'))
+        self.ratings = None
         self.reference_models = load_reference_models(self.config)
+        # only matches of the models of this run, played with its ELO or reference model settings
+        self.tournament_results = self.match_database.tournament_table(
+            [tournament.match_settings(self.config['ELO']),
+             win_position.match_settings(self.config['VS REFERENCE MODELS'])],
+            set(self.get_model_name(idx) for idx in range(self.start_index + 1)) | set(self.reference_models))
+        self.curriculum = parse_curriculum(self.config.get('REPEATED SELF TRAINING', 'curriculum', fallback=''),
+            self.config.getint('CREATE MODEL', 'board_size'))
 
     def get_model_name(self, i):
         return '%s_%04d' % (self.model_name, i)
@@ -49,6 +77,23 @@ class RepeatedSelfTrainer:
     def get_data_files(self, i):
         return [self.get_model_name(idx) for idx in range(i)]
 
+    def self_play_model_name(self, i):
+        """
+        the model which generates the data of iteration i, the best model so far with gating, else the latest
+        """
+        if self.config.getboolean('GATING', 'enabled', fallback=False):
+            return self.best_model_name
+        return self.get_model_name(i-1)
+
+    def board_sizes(self, i):
+        """
+        the board sizes of the self-play games of iteration i, None without curriculum
+        before the first stage starts the smallest size is played
+        """
+        if not self.curriculum:
+            return None
+        return sorted(set(size for iteration, size in self.curriculum if iteration <= i)) or [self.curriculum[0][1]]
+
     def prepare_rst(self):
         training_data, validation_data = self.initial_data()
 
@@ -57,31 +102,60 @@ class RepeatedSelfTrainer:
 
         self.model_names.append(self.get_model_name(self.start_index))
         self.sorted_model_names = self.model_names[:]
+        self.best_model_name = self.get_model_name(self.start_index)
 
         self.training_data = self.check_enough_data(training_data, self.train_samples)
         self.validation_data = self.check_enough_data(validation_data, self.val_samples)
 
     def rst_loop(self, i):
+        """
+        runs iteration i, optionally under a profiler, and reports where the time went
+        """
+        if self.config.getint('PROFILING', 'capture_iteration', fallback=0) == i:
+            profiler = self.config.get('PROFILING', 'profiler', fallback='cprofile')
+            extension = 'json' if profiler == 'torch' else 'prof'
+            output_dir = self.config.get('PROFILING', 'output_dir', fallback='logs')
+            file_name = os.path.join(output_dir, f'{self.get_model_name(i)}.{extension}')
+            with capture(profiler, file_name):
+                self.rst_iteration(i)
+        else:
+            self.rst_iteration(i)
+        timer.report(i)
+
+    def rst_iteration(self, i):
         train_samples_per_model = self.train_samples // self.num_data_models
         val_samples_per_model = self.val_samples // self.num_data_models
         start = ((i-1) % self.num_data_models)
-        new_train_triple = self.create_data_samples(self.get_model_name(i-1),
-            train_samples_per_model)
-        new_val_triple = self.create_data_samples(self.get_model_name(i-1),
-            val_samples_per_model, verbose=False)
+        board_sizes = self.board_sizes(i)
+        if board_sizes is not None and board_sizes != self.board_sizes(i-1):
+            logger.info(f'curriculum: self-play on board sizes {board_sizes}')
+        with timer.stage('self_play'):
+            new_train_triple = self.create_data_samples(self.self_play_model_name(i),
+                train_samples_per_model, board_sizes=board_sizes)
+            new_val_triple = self.create_data_samples(self.self_play_model_name(i),
+                val_samples_per_model, verbose=False, board_sizes=board_sizes)
+        timer.count('positions', len(new_train_triple[0]) + len(new_val_triple[0]))
         for idx in range(3):
             self.training_data[idx][start*train_samples_per_model : (start+1) * \
                 train_samples_per_model] = new_train_triple[idx]
             self.validation_data[idx][start*val_samples_per_model : (start+1) * \
                 val_samples_per_model] = new_val_triple[idx]
-        self.train_model(self.get_model_name(i-1), self.get_model_name(i), self.training_data,
-            self.validation_data)
+        with timer.stage('training'):
+            self.train_model(self.get_model_name(i-1), self.get_model_name(i), self.training_data,
+                self.validation_data)
         self.model_names.append(self.get_model_name(i))
-        #self.create_all_elo_ratings()
-        self.measure_win_counts(self.get_model_name(i), self.reference_models, verbose=True)
+        if self.config.getboolean('REPEATED SELF TRAINING', 'elo_ratings', fallback=False):
+            with timer.stage('elo_ratings'):
+                self.create_all_elo_ratings()
+        with timer.stage('win_counts'):
+            self.measure_win_counts(self.get_model_name(i), self.reference_models, verbose=True)
+        if self.config.getboolean('GATING', 'enabled', fallback=False):
+            with timer.stage('gating'):
+                self.gate(self.get_model_name(i))
 
     def repeated_self_training(self):
         self.prepare_rst()
+        timer.reset()
 
         for i in range(self.start_index + 1, self.start_index + 1 + self.config.
             getint('REPEATED SELF TRAINING', 'num_iterations')):
@@ -95,13 +169,16 @@ class RepeatedSelfTrainer:
 
     def create_initial_model(self):
         config = self.config['CREATE MODEL']
+        if self.curriculum:
+            config['size_biases'] = ','.join(str(size) for _, size in self.curriculum)
         create_model.create_and_store_model(config, self.get_model_name(0))
         return
 
-    def create_data_samples(self, model_name, num_samples, verbose=True):
-        model = load_model(f'models/{model_name}.pt')
+    def create_data_samples(self, model_name, num_samples, verbose=True, board_sizes=None):
+        with timer.stage('load_model'):
+            model = registry.get_model(model_name)
         self_play_args = self.config['CREATE DATA']
-        return create_data.create_self_play_data(self_play_args, model, num_samples, verbose)
+        return create_data.create_self_play_data(self_play_args, model, num_samples, verbose, board_sizes)
 
     def initial_data(self):
         if self.config.getboolean('REPEATED SELF TRAINING', 'load_initial_data'):
@@ -114,16 +191,17 @@ class RepeatedSelfTrainer:
             logger.info('=== creating random initial data ===')
             model = RandomModel(self.config.getint('CREATE MODEL', 'board_size'))
             self_play_args = self.config['CREATE DATA']
+            board_sizes = self.board_sizes(self.start_index + 1)
             training_data = create_data.create_self_play_data(self_play_args, model,
-                self.train_samples, verbose=False)
+                self.train_samples, verbose=False, board_sizes=board_sizes)
             validation_data = create_data.create_self_play_data(self_play_args, model,
-                self.val_samples, verbose=False)
+                self.val_samples, verbose=False, board_sizes=board_sizes)
             return training_data, validation_data
 
     def check_enough_data(self, data, amount):
         if len(data[0]) < amount:
             new_data_triple = self.create_data_samples(self.get_model_name(self.start_index),
-                amount - len(data[0]), verbose=False)
+                amount - len(data[0]), verbose=False, board_sizes=self.board_sizes(self.start_index + 1))
             for idx in range(3):
                 data[idx] = torch.cat((data[idx], new_data_triple[idx]), 0)
             return data
@@ -148,9 +226,10 @@ class RepeatedSelfTrainer:
             self.sorted_model_names,
             self.model_names[-1],
             args,
-            self.tournament_results
+            self.tournament_results,
+            self.match_database
         )
-        ratings = elo.create_ratings(self.tournament_results)
+        ratings = self.update_ratings()
         writer.add_scalar('elo', ratings[self.model_names[-1]])
 
         self.sorted_model_names.append(self.model_names[-1])
@@ -168,7 +247,7 @@ class RepeatedSelfTrainer:
         for reference_idx in range(1, len(self.reference_models)):
             self.measure_win_counts(self.reference_models[reference_idx],
                 self.reference_models[:reference_idx], verbose=False)
-        ratings = elo.create_ratings(self.tournament_results)
+        ratings = self.update_ratings()
         best_trained_model = max(self.model_names[1:], key=lambda name: ratings[name])
         best_reference_model = max(self.reference_models + self.model_names[0:1],
             key=lambda name: ratings[name])
@@ -176,15 +255,55 @@ class RepeatedSelfTrainer:
         logger.info(f"ELO difference between best trained model and best reference model: {diff:0.2f}")
         return diff
 
+    def gating_match(self, candidate_name, incumbent_name):
+        """
+        plays candidate against incumbent with the settings of [GATING], stopping early once the SPRT is decided
+        the candidate is the first model of the match, so the SPRT tests whether the candidate is stronger
+        returns the SPRT decision: 'H1' if the candidate is stronger, 'H0' if it is not and None if undecided,
+        the number of games and the win rate of the candidate
+        """
+        args = self.config['GATING']
+        results = tournament.play_pairs([(candidate_name, incumbent_name)], args, self.match_database)
+        wins = results[candidate_name][incumbent_name]
+        losses = results[incumbent_name][candidate_name]
+        sprt = SPRT.from_config(args) or SPRT()
+        status = sprt.status(wins, losses)
+        logger.info(f'gating: {candidate_name} won {wins} / {wins + losses} games against {incumbent_name}, '
+            f'SPRT decision: {status}')
+        return status, wins + losses, wins / max(wins + losses, 1)
+
+    def gate(self, candidate_name):
+        """
+        promotes candidate to the best model, which generates the self-play data, if it is stronger than the
+        current best model: the SPRT accepts H1, or it is undecided after at least min_promotion_games games
+        and the win rate reaches promotion_threshold
+        matches already in the match database are not replayed
+        """
+        status, num_games, win_rate = self.gating_match(candidate_name, self.best_model_name)
+        args = self.config['GATING']
+        promoted = status == 'H1' or (status is None and
+            num_games >= args.getint('min_promotion_games', fallback=100) and
+            win_rate >= args.getfloat('promotion_threshold', fallback=0.55))
+        writer.add_scalar('gating/win_rate', win_rate)
+        writer.add_scalar('gating/promoted', int(promoted))
+        if promoted:
+            logger.info(f'gating: {candidate_name} replaces {self.best_model_name} as best model')
+            self.best_model_name = candidate_name
+        else:
+            logger.info(f'gating: {self.best_model_name} stays best model')
+        return promoted
+
+    def update_ratings(self):
+        """
+        recomputes the ratings of the tournament, warm-started from the previous ratings
+        """
+        self.ratings = elo.create_ratings(self.tournament_results, initial_ratings=self.ratings)
+        return self.ratings
+
     def measure_win_counts(self, model_name, reference_model_names, verbose):
-        reference_models = {}
-        for model in reference_model_names:
-            if model == "random":
-                reference_models["random"] = RandomModel(self.config.getint('CREATE MODEL', 'board_size'))
-            else:
-                reference_models[model] = load_model(f'models/{model}.pt')
-        results = win_position.win_count(model_name, reference_models,
-            self.config['VS REFERENCE MODELS'], verbose)
+        results = win_position.win_count(model_name, reference_model_names,
+            self.config['VS REFERENCE MODELS'], verbose, self.config.getint('CREATE MODEL', 'board_size'),
+            self.match_database)
         self.tournament_results = merge_dicts_of_dicts(self.tournament_results, results)
 
 
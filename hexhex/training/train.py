@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import copy
 import math
-import os
 
 import numpy as np
 import torch
@@ -9,6 +8,7 @@ import torch.nn as nn
 from torch.utils.data.dataset import TensorDataset
 
 from hexhex.creation import puzzle
+from hexhex.model import checkpoint, padding
 from hexhex.utils.logger import logger
 from hexhex.utils.summary import writer
 from hexhex.utils.utils import device, load_model, create_optimizer, Average
@@ -65,14 +65,18 @@ class TrainingStats:
         )
 
 
-def train_model(model, train_dataloader, val_dataloader, optimizer, puzzle_triple, config):
+def train_model(model, train_dataloader, val_dataloader, optimizer, puzzle_set, config, mixed_sizes=False):
+    """
+    with mixed_sizes the data holds boards smaller than model.board_size, whose sizes are passed to the model
+    """
     criterion = lambda pred, y: 0.8*nn.L1Loss(reduction='sum')(pred, y)+0.2*nn.BCELoss(reduction='sum')(pred, y)
 
     def measure_loss(data_triple, eval_mode):
         def _measure_loss_impl(data_triple):
             board_states, moves, labels = data_triple
+            sizes = padding.board_sizes(board_states).to(device) if mixed_sizes else None
             board_states, moves, labels = board_states.to(device), moves.to(device), labels.to(device)
-            outputs = torch.sigmoid(model(board_states))
+            outputs = torch.sigmoid(model(board_states, sizes))
             output_values = torch.gather(outputs, 1, moves)
             return criterion(output_values.view(-1), labels)
 
@@ -107,17 +111,19 @@ def train_model(model, train_dataloader, val_dataloader, optimizer, puzzle_tripl
                 l2loss = measure_weight_loss()
                 weighted_param_loss = weight_decay * l2loss
 
-                puzzle_loss = Average()
-                if puzzle_triple is not None:
-                    puzzle_loss.add(measure_loss(puzzle_triple, eval_mode=True), len(puzzle_triple[0]))
+                puzzle_stats = {'loss': 0., 'value_accuracy': 0., 'move_accuracy': 0.}
+                if puzzle_set is not None:
+                    puzzle_stats = puzzle.evaluate_puzzle(model, puzzle_set, criterion)
 
                 logger.info(
                     f'batch {i + 1:3} / {len(train_dataloader):3} '
-                    f'puzzle_loss: {puzzle_loss.mean():.3f} '
+                    f'puzzle_loss: {puzzle_stats["loss"]:.3f} '
+                    f'puzzle_move_accuracy: {puzzle_stats["move_accuracy"]:.3f} '
                     f'l2_param_loss: {l2loss:.3f} '
                     f'weighted_param_loss: {weighted_param_loss:.3f}'
                 )
-                writer.add_scalar('train/puzzle_loss', puzzle_loss.mean())
+                for name, value in puzzle_stats.items():
+                    writer.add_scalar(f'train/puzzle_{name}', value)
                 writer.add_scalar('train/l2_weights', l2loss)
 
         val_loss = Average()
@@ -173,25 +179,24 @@ def train(config, training_data, validation_data):
         weight_decay=config.getfloat('weight_decay')
     )
 
-    puzzle_file = f'data/{model.board_size}_puzzle.pt'
-    if not os.path.exists(puzzle_file):
-        logger.info("")
-        logger.info("=== creating missing puzzle file ===")
-        puzzle_config = copy.deepcopy(config)
-        puzzle_config['board_size'] = str(model.board_size)
-        puzzle.create_puzzle(puzzle_config)
-
-    puzzle_triple = torch.load(puzzle_file, map_location=device)
+    puzzle_config = copy.deepcopy(config)
+    puzzle_config['board_size'] = str(model.board_size)
+    puzzle_set = puzzle.load_puzzle(puzzle_config)
+    # e.g. the data of a board size curriculum, decided once here instead of per batch on the device
+    mixed_sizes = any(bool((padding.board_sizes(data[0]) != model.board_size).any())
+                      for data in (training_data, validation_data))
 
     trained_model, trained_optimizer = train_model(model=model,
                                                    train_dataloader=train_loader,
                                                    val_dataloader=val_loader,
                                                    optimizer=optimizer,
-                                                   puzzle_triple=puzzle_triple,
-                                                   config=config)
-
-    checkpoint = torch.load(model_file, map_location=device)
-    checkpoint['model_state_dict'] = trained_model.state_dict()
-    file_name = f'models/{config.get("save_model")}.pt'
-    torch.save(checkpoint, file_name)
+                                                   puzzle_set=puzzle_set,
+                                                   config=config,
+                                                   mixed_sizes=mixed_sizes)
+
+    model_config, _, metadata = checkpoint.load_checkpoint(model_file)
+    file_name = checkpoint.save_model('models', config.get('save_model'), trained_model.state_dict(), model_config, {
+        'parent': config.get('load_model'),
+        'generation': metadata.get('generation', 0) + 1,
+    })
     logger.info(f'wrote {file_name}')
@@ -0,0 +1,19 @@
+import importlib
+
+
+class LazyModule:
+    """
+    stands in for a module that is only imported on first attribute access
+    imports from several threads are serialized by the import lock
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        return f'<lazy module {self._name}>'
@@ -2,27 +2,48 @@
 import logging
 from configparser import ConfigParser
 
-config = ConfigParser()
-config.read('config.ini')
-
 logger = logging.getLogger('hexhex')
 logger.setLevel(logging.DEBUG)
+logger.propagate = False
 
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-# handler for file output
-if config.get('LOGGING', 'file', fallback="") != "":
-    fh = logging.FileHandler(config.get('LOGGING', 'file'), mode=config.get('LOGGING', 'file_mode'))
-    fh.setLevel(config.get('LOGGING', 'file_level'))
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
+def configure_handlers():
+    """
+    adds the file and console handlers configured in the [LOGGING] section of config.ini
+    """
+    config = ConfigParser()
+    config.read('config.ini')
 
-# handle for console output
-ch = logging.StreamHandler()
-ch.setLevel(config.get('LOGGING', 'console_level', fallback="INFO"))
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-# create formatter and add it to the handlers
-ch.setFormatter(formatter)
-# add the handlers to the logger
-logger.addHandler(ch)
-logger.propagate = False
+    # handler for file output, the file is only opened once something is logged
+    if config.get('LOGGING', 'file', fallback="") != "":
+        fh = logging.FileHandler(config.get('LOGGING', 'file'), mode=config.get('LOGGING', 'file_mode'), delay=True)
+        fh.setLevel(config.get('LOGGING', 'file_level'))
+        fh.setFormatter(formatter)
+        logger.addHandler(fh)
+
+    # handle for console output
+    ch = logging.StreamHandler()
+    ch.setLevel(config.get('LOGGING', 'console_level', fallback="INFO"))
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+
+class ConfigureOnFirstUse(logging.Filter):
+    """
+    reads config.ini when the first record is logged instead of at import time,
+    the logger applies its filters before it passes a record to the handlers
+    """
+    def __init__(self):
+        super(ConfigureOnFirstUse, self).__init__()
+        self.configured = False
+
+    def filter(self, record):
+        if not self.configured:
+            self.configured = True
+            configure_handlers()
+        return True
+
+
+logger.addFilter(ConfigureOnFirstUse())
@@ -0,0 +1,96 @@
+import cProfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import torch
+
+from hexhex.utils.logger import logger
+from hexhex.utils.summary import writer
+
+
+class StageTimer:
+    """
+    accumulates wall clock seconds per stage and counters between two calls of report
+    stages may be nested, each one is timed on its own
+    """
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def reset(self):
+        self.seconds.clear()
+        self.counters.clear()
+
+    def report(self, step=None):
+        """
+        logs all stages and counters and writes them to tensorboard under profile/, then resets
+        rates are derived for the counters positions and forward_passes, and the saved plies and overturned decisions
+        of adjudication, estimated from its calibration games
+        """
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            logger.info(f'profile: {name:25} {seconds:9.2f}s')
+            writer.add_scalar(f'profile/{name}_seconds', seconds, step)
+        for name, value in sorted(self.counters.items()):
+            logger.info(f'profile: {name:25} {value:9}')
+            writer.add_scalar(f'profile/{name}', value, step)
+
+        rates = {}
+        if self.counters['positions'] > 0 and self.seconds['self_play'] > 0:
+            rates['positions_per_second'] = self.counters['positions'] / self.seconds['self_play']
+        if self.counters['forward_passes'] > 0:
+            rates['mean_batch_size'] = self.counters['forward_positions'] / self.counters['forward_passes']
+        game_seconds = self.seconds['game_model'] + self.seconds['game_board']
+        if game_seconds > 0:
+            rates['board_logic_fraction'] = self.seconds['game_board'] / game_seconds
+        for kind in ('virtual_connections', 'resignations'):
+            triggers = self.counters[f'calibration_{kind}']
+            if triggers > 0:
+                rates[f'{kind}_overturned_fraction'] = self.counters[f'calibration_{kind}_overturned'] / triggers
+                rates[f'{kind}_saved_plies'] = \
+                    self.counters[kind] * self.counters[f'calibration_{kind}_remaining_plies'] / triggers
+        for name, value in rates.items():
+            logger.info(f'profile: {name:25} {value:9.2f}')
+            writer.add_scalar(f'profile/{name}', value, step)
+        self.reset()
+
+
+timer = StageTimer()
+
+
+@contextmanager
+def capture(profiler, file_name):
+    """
+    profiles the enclosed code with profiler 'cprofile' or 'torch' and writes the result to file_name
+    cProfile stats can be read with python -m pstats, torch traces with chrome://tracing
+    """
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(file_name)
+    elif profiler == 'torch':
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with torch.profiler.profile(activities=activities, record_shapes=True) as profile:
+            yield
+        profile.export_chrome_trace(file_name)
+        logger.info(profile.key_averages().table(sort_by='self_cpu_time_total', row_limit=20))
+    else:
+        raise ValueError(f'unknown profiler {profiler}')
+    logger.info(f'wrote profile {file_name}')
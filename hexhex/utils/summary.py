@@ -1,6 +1,17 @@
-from torch.utils.tensorboard import SummaryWriter
+class LazySummaryWriter:
+    """
+    creates the tensorboard SummaryWriter, and with it the runs/ directory, only when it is first used
+    """
+    def __init__(self):
+        self._writer = None
 
-writer = SummaryWriter()
+    def __getattr__(self, attribute):
+        if self._writer is None:
+            from torch.utils.tensorboard import SummaryWriter
+            self._writer = SummaryWriter()
+            layout = {'training': {'val/train loss': ['Multiline', ['train/train_loss', 'train/val_loss']]}}
+            self._writer.add_custom_scalars(layout)
+        return getattr(self._writer, attribute)
 
-layout = {'training': {'val/train loss': ['Multiline', ['train/train_loss', 'train/val_loss']]}}
-writer.add_custom_scalars(layout)
\ No newline at end of file
+
+writer = LazySummaryWriter()
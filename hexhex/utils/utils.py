@@ -5,29 +5,12 @@ import torch
 import torch.optim as optim
 
 from hexhex.creation.create_model import create_model
+from hexhex.model.checkpoint import load_checkpoint
 from hexhex.utils.logger import logger
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
-def _one_pass(iters):
-    for it in iters:
-        try:
-            yield next(it)
-        except StopIteration:
-            pass
-
-
-def zip_list_of_lists(*iterables):
-    iters = [iter(it) for it in iterables]
-    output_list = []
-    while True:
-        iter_list = list(_one_pass(iters))
-        output_list.extend(list(iter_list))
-        if iter_list==[]:
-            return output_list
-
-
 def correct_position1d(position1d, board_size, player):
     if player:
         return position1d//board_size + (position1d%board_size)*board_size
@@ -36,9 +19,10 @@ def correct_position1d(position1d, board_size, player):
 
 
 def load_model(model_file, export_mode=False):
-    checkpoint = torch.load(model_file, map_location=device)
-    model = create_model(checkpoint['config'], export_mode)
-    model.load_state_dict(checkpoint['model_state_dict'])
+    config, state_dict, _ = load_checkpoint(model_file)
+    model = create_model(config, export_mode)
+    # the parameters keep the copy-on-write memory maps of the checkpoint instead of copies
+    model.load_state_dict(state_dict, assign=True)
     model.eval()
     torch.no_grad()
     return model
@@ -61,10 +45,25 @@ def create_optimizer(optimizer_type, parameters, learning_rate, momentum, weight
         raise SystemExit
 
 
-def get_targets(boards, gamma):
-    target_list = [[0.5 + 0.5 * (-1) ** k * (1 - gamma) ** (2 * (k//2)) for k in reversed(range(len(
-        board.move_history)))] for board in boards]
-    return torch.tensor(zip_list_of_lists(*target_list), device=torch.device('cpu'))
+def ply_major_mask(game_lengths):
+    """
+    mask of shape (max game length, number of games) which is True where game g has a ply p
+    selecting with it yields the order in which MultiHexGame records positions: ply by ply, games in order
+    """
+    plies = torch.arange(int(game_lengths.max()) if len(game_lengths) > 0 else 0)
+    return plies.unsqueeze(1) < game_lengths.unsqueeze(0)
+
+
+def get_targets(game_lengths, gamma):
+    """
+    value targets of all recorded positions in ply major order
+    game_lengths holds the number of recorded plies per game, the player of the last ply has won
+    a position k plies before the end has target 1 or 0, decayed towards 0.5 by (1 - gamma) per move pair
+    """
+    mask = ply_major_mask(game_lengths)
+    plies_to_end = (game_lengths.unsqueeze(0) - 1 - torch.arange(mask.shape[0]).unsqueeze(1))[mask]
+    sign = 1 - 2 * (plies_to_end % 2)
+    return 0.5 + 0.5 * sign * (1 - gamma) ** (2 * (plies_to_end // 2)).float()
 
 
 def merge_dicts_of_dicts(dict1, dict2):